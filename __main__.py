@@ -1,2 +1,6 @@
 #!/usr/bin/python3
 import main
+import sys
+
+if __name__ == "__main__":
+    main.main(sys.argv[1:])
@@ -1,54 +1,152 @@
 from xml.etree import ElementTree
+from .item import gen_definition
+from .shared import SharedFunctions
+
+class XmlStream:
+    """
+    Writes an XML document out one element at a time, so that the elements
+    never need to be held in memory together
+    """
+    def __init__(self, path, tag, attrib={}):
+        """
+        Open a new document
+        -- path: Path of the file to write to
+        -- tag: Tag of the root element
+        -- attrib: Attributes of the root element
+        """
+        root = ElementTree.Element(tag, attrib)
+        text = ElementTree.tostring(root, "unicode", short_empty_elements=False)
+        self.close_tag = "</{}>".format(tag)
+        self.file = open(path, 'w')
+        self.file.write(text[:-len(self.close_tag)])
+    def write(self, element):
+        """
+        Write an element to the root of the document
+        """
+        self.file.write(ElementTree.tostring(element, "unicode"))
+    def close(self):
+        """
+        Close the root element and the file
+        """
+        self.file.write(self.close_tag)
+        self.file.close()
+
+def add_hooks(hooks, item, position):
+    """
+    Add an item to the list of items of every callback it implements
+    -- hooks: Dictionary of callback names to lists of item positions
+    -- item: Item or record to add
+    -- position: Position of the item in the list of names, from 1
+    """
+    for hook in item.get_hooks():
+        if not hook in hooks:
+            hooks[hook] = []
+        hooks[hook].append(position)
+
+def write_list(script, table, values):
+    """
+    Write out a Lua list
+    -- script: File to write to
+    -- table: Name of the table in Mod to write to
+    -- values: Values of the list, which are written as Lua code
+    """
+    script.write("Mod.{} = {{\n".format(table))
+    for value in values:
+        script.write("\t{},\n".format(value))
+    script.write("}\n")
 
 class Generator:
-    def __init__(self, script):
-        self.xml_item = ElementTree.Element("items")
-        self.xml_item.set('gfxroot', 'gfx/items/')
-        self.xml_item.set('version', '1')
-        self.xml_pool = ElementTree.Element("ItemPools")
-        self.xml_entity = ElementTree.Element("entities")
-        self.xml_entity.set('anm2root', 'gfx/')
-        self.xml_entity.set('version', '5')
-        self.xml_pocket = ElementTree.Element("pocketitems")
+    def __init__(self, script, items_path, entities_path, pools_path,
+                 pocketitems_path, lazy=False, share=True):
+        """
+        Create a new generator
+        Items are written out to the XML files as soon as they are added, and
+        pools once the generator is closed
+        -- script: File to write the Lua script to
+        -- items_path: Path to write items.xml to
+        -- entities_path: Path to write entities2.xml to
+        -- pools_path: Path to write itempools.xml to
+        -- pocketitems_path: Path to write pocketitems.xml to
+        -- lazy: Write item definitions as functions that create them, so
+        that the mod only creates the items that are used in a run
+        -- share: Write functions that several items have in common once
+        """
+        self.lazy = lazy
+        self.shared = None
+        if share:
+            self.shared = SharedFunctions(script)
+        self.xml_item = XmlStream(items_path, "items",
+            {"gfxroot": "gfx/items/", "version": "1"})
+        self.xml_entity = XmlStream(entities_path, "entities",
+            {"anm2root": "gfx/", "version": "5"})
+        self.xml_pocket = XmlStream(pocketitems_path, "pocketitems")
+        self.pools_path = pools_path
         self.lua_script = script
+        # Names of the items in each pool, by pool name
         self.pools = {}
         self.items = {}
         self.itemnames = []
         self.trinkets = {}
-        self.pills = {}
+        self.pillnames = []
         self.costumes = {}
+        # Positions of the items and trinkets that implement each callback,
+        # and of the items that are familiars
+        self.item_hooks = {}
+        self.trinket_hooks = {}
+        self.familiars = []
 
     def add_item(self, item, shortname=None):
-        self.xml_item.append(item.gen_xml())
+        """
+        Add an item to the mod
+        -- item: IsaacItemRecord of the item
+        -- shortname: Name of the item without its number
+        """
+        self.xml_item.write(item.gen_xml())
         familiar = item.gen_familiar_xml()
         if familiar != None:
-            self.xml_entity.append(familiar)
+            self.xml_entity.write(familiar)
         for pool in item.get_pools():
             if not pool in self.pools:
-                xml_pool = ElementTree.Element("Pool")
-                xml_pool.set("Name", pool)
-                self.pools[pool] = xml_pool
-                self.xml_pool.append(xml_pool)
-            xml_pooldef = ElementTree.Element("Item")
-            xml_pooldef.set("Weight", "1")
-            xml_pooldef.set("Name", item.name)
-            xml_pooldef.set("DecreaseBy", "1")
-            xml_pooldef.set("RemoveOn", "0.1")
-            self.pools[pool].append(xml_pooldef)
-        self.lua_script.write("Mod.items[\"{}\"] = {}".format(
-            item.name, item.get_definition()))
+                self.pools[pool] = []
+            self.pools[pool].append(item.name)
+        definition = self.get_definition(item)
+        if self.lazy:
+            self.lua_script.write(
+                "Mod.item_loaders[\"{}\"] = function() return {}end\n".format(
+                item.name, definition))
+        else:
+            self.lua_script.write("Mod.items[\"{}\"] = {}".format(
+                item.name, definition))
         self.items[item.name] = item.name
         if shortname != None:
             self.items[shortname] = item.name
         self.itemnames.append(item.name)
+        add_hooks(self.item_hooks, item, len(self.itemnames))
+        if familiar != None:
+            self.familiars.append(len(self.itemnames))
         if item.costume != None:
             self.costumes[item.name] = item.costume
 
     def add_trinket(self, trinket):
+        """
+        Add a trinket to the mod
+        -- trinket: IsaacItemRecord of the trinket
+        """
         self.trinkets[trinket.name] = trinket.name
-        self.xml_item.append(trinket.gen_xml())
+        add_hooks(self.trinket_hooks, trinket, len(self.trinkets))
+        self.xml_item.write(trinket.gen_xml())
         self.lua_script.write("Mod.trinkets[\"{}\"] = {}".format(
-            trinket.name, trinket.get_definition()))
+            trinket.name, self.get_definition(trinket)))
+
+    def get_definition(self, item):
+        """
+        Get the definition of an item or trinket, using shared functions
+        where it can
+        -- item: IsaacItemRecord to get the definition of
+        """
+        if self.shared == None:
+            return item.get_definition()
+        return gen_definition([self.shared.share(x) for x in item.get_functions()])
 
     def has_trinket(self, name):
         return name in self.trinkets
@@ -57,10 +155,15 @@ class Generator:
         return name in self.items
 
     def script_generate_itemnames(self):
-        self.lua_script.write("Mod.item_names = {\n")
-        for name in self.itemnames:
-            self.lua_script.write("\t\"{}\",\n".format(name))
-        self.lua_script.write("}\n")
+        """
+        Write out the names of the items and trinkets, in the order they are
+        in items.xml, along with what is known about them
+        """
+        write_list(self.lua_script, "item_names",
+            ("\"{}\"".format(name) for name in self.itemnames))
+        write_list(self.lua_script, "trinket_names",
+            ("\"{}\"".format(name) for name in self.trinkets))
+        write_list(self.lua_script, "familiar_items", self.familiars)
         self.lua_script.write("Mod.costumes = {\n")
         for name, costume in self.costumes.items():
             if isinstance(costume, int):
@@ -68,21 +171,57 @@ class Generator:
             else:
                 self.lua_script.write("\t[\"{}\"] = \"{}\",\n".format(name, costume))
         self.lua_script.write("}\n")
+        self.script_generate_hooks("item_hooks", self.item_hooks)
+        self.script_generate_hooks("trinket_hooks", self.trinket_hooks)
+
+    def script_generate_hooks(self, table, hooks):
+        """
+        Write out the positions of the items that implement each callback
+        -- table: Name of the table in Mod to write to
+        -- hooks: Dictionary of callback names to lists of item positions
+        """
+        self.lua_script.write("Mod.{} = {{\n".format(table))
+        for hook, positions in hooks.items():
+            self.lua_script.write("\t[\"{}\"] = {{{}}},\n".format(
+                hook, ", ".join(str(x) for x in positions)))
+        self.lua_script.write("}\n")
+
+    def script_generate_pillnames(self):
+        """
+        Write out the names of the pills, in the order they are in
+        pocketitems.xml
+        """
+        write_list(self.lua_script, "pill_names",
+            ("\"{}\"".format(name) for name in self.pillnames))
 
     def add_pocket_pill(self, name, script):
         xml = ElementTree.Element("pilleffect")
         xml.set("name", name)
-        self.xml_pocket.append(xml)
+        self.xml_pocket.write(xml)
+        self.pillnames.append(name)
+        if self.shared != None:
+            script = self.shared.share(script)
         self.lua_script.write("Mod.pills[\"{}\"] = {}\n".format(name, script))
 
-    def write_items(self, path):
-        ElementTree.ElementTree(self.xml_item).write(path, "unicode")
-
-    def write_entities(self, path):
-        ElementTree.ElementTree(self.xml_entity).write(path, "unicode")
-
-    def write_pools(self, path):
-        ElementTree.ElementTree(self.xml_pool).write(path, "unicode")
+    def write_pools(self):
+        xml_pools = XmlStream(self.pools_path, "ItemPools")
+        for pool, names in self.pools.items():
+            xml_pool = ElementTree.Element("Pool")
+            xml_pool.set("Name", pool)
+            for name in names:
+                xml_pooldef = ElementTree.SubElement(xml_pool, "Item")
+                xml_pooldef.set("Weight", "1")
+                xml_pooldef.set("Name", name)
+                xml_pooldef.set("DecreaseBy", "1")
+                xml_pooldef.set("RemoveOn", "0.1")
+            xml_pools.write(xml_pool)
+        xml_pools.close()
 
-    def write_pocketitems(self, path):
-        ElementTree.ElementTree(self.xml_pocket).write(path, "unicode")
+    def close(self):
+        """
+        Write out the item pools and finish every XML file
+        """
+        self.write_pools()
+        self.xml_item.close()
+        self.xml_entity.close()
+        self.xml_pocket.close()
@@ -0,0 +1,242 @@
+from . import util
+import os
+import glob
+import json
+import random
+import pickle
+import hashlib
+import fnmatch
+
+# Brief rundown of incremental builds:
+# Every item records the paths of the templates and sprite parts that were
+# used to generate it. The digest of an item is made from its name, seed, the
+# contents of those files, and the generator code itself. If the digest of an
+# item is the same as in the last build, its record is loaded from the cache
+# instead of being generated again, and its sprite is left as it is.
+
+# Files that every item depends on, on top of the files that it uses
+CONST_CODE_FILES = [
+    "generators/*.py",
+    "generators/hints.txt",
+    "generators/script/baseanim.xml",
+    "costumenames.json",
+]
+# Change this to throw away old manifests
+CONST_MANIFEST_VERSION = 3
+
+MANIFEST_PATH = os.path.join(util.CACHE_FOLDER, "manifest.json")
+RECORDS_PATH = os.path.join(util.CACHE_FOLDER, "records")
+# Single copies of generated files, which outputs are hardlinked to
+BLOBS_PATH = os.path.join(util.CACHE_FOLDER, "blobs")
+# Master seed of builds that are not given one
+SEED_PATH = os.path.join(util.CACHE_FOLDER, "seed.txt")
+
+def get_default_seed(path=SEED_PATH):
+    """
+    Get the master seed to use when none is given, so that builds keep
+    planning the same items until the cache is removed. A new seed is picked
+    the first time.
+    -- path: Path of the file that the seed is kept in
+    """
+    if os.path.isfile(path):
+        with open(path, 'r') as fh:
+            seed = fh.read().strip()
+        if seed != "":
+            return seed
+    seed = "{:016x}".format(random.SystemRandom().getrandbits(64))
+    util.check_folder(os.path.dirname(path))
+    with open(path, 'w') as fh:
+        fh.write(seed + "\n")
+    return seed
+
+cached_digests = {}
+def get_file_digest(path):
+    """
+    Get the digest of the contents of a file, or None if it does not exist
+    -- path: Path of the file
+    """
+    path = os.path.normpath(path)
+    if not path in cached_digests:
+        if os.path.isfile(path):
+            with open(path, 'rb') as fh:
+                cached_digests[path] = hashlib.blake2b(fh.read(),
+                    digest_size=16).hexdigest()
+        else:
+            cached_digests[path] = None
+    return cached_digests[path]
+
+def forget_file(path):
+    """
+    Forget the digest of a file, after it has changed
+    -- path: Path of the file
+    """
+    cached_digests.pop(os.path.normpath(path), None)
+
+def is_code_file(path):
+    """
+    Check if every item depends on a file
+    -- path: Path of the file
+    """
+    path = os.path.normpath(path)
+    return any(fnmatch.fnmatch(path, os.path.normpath(pattern))
+               for pattern in CONST_CODE_FILES)
+
+def get_code_version():
+    """
+    Get the digest of all of the generator code and data that every item uses
+    """
+    ret = hashlib.blake2b(digest_size=16)
+    for pattern in CONST_CODE_FILES:
+        for path in sorted(glob.glob(pattern)):
+            ret.update(path.encode("utf-8"))
+            ret.update(str(get_file_digest(path)).encode("utf-8"))
+    return ret.hexdigest()
+
+def load_manifest(path=MANIFEST_PATH):
+    """
+    Load the manifest of the last build
+    Returns None if there is none, or it was written by another version
+    -- path: Path of the manifest file
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as fh:
+        data = json.load(fh)
+    if data.get("version") != CONST_MANIFEST_VERSION:
+        return None
+    return data
+
+class BuildManifest:
+    """
+    Keeps track of the items in a build and the inputs they were made from
+    """
+    def __init__(self, settings={}, path=MANIFEST_PATH, records_path=RECORDS_PATH):
+        """
+        Load the manifest of the last build
+        -- settings: Settings that change how files are written out. If they
+        are not the same as in the last build, every item is generated again.
+        -- path: Path of the manifest file
+        -- records_path: Folder that cached item records are kept in
+        """
+        self.path = path
+        self.records_path = records_path
+        self.settings = settings
+        self.old_settings = None
+        self.code_version = get_code_version()
+        self.old_items = {}
+        # Names of the items that use each file, by path
+        self.dependents = {}
+        self.items = {}
+        self.hits = 0
+        self.misses = 0
+        data = load_manifest(path)
+        if data != None:
+            self.old_items = data["items"]
+            self.dependents = data["dependents"]
+            self.old_settings = data["settings"]
+    def get_digest(self, job, deps):
+        """
+        Get the digest of the inputs of an item
+        -- job: (name, seed, trinket) tuple of the item
+        -- deps: Paths of the files the item was generated from
+        """
+        ret = hashlib.blake2b(digest_size=16)
+        ret.update(self.code_version.encode("utf-8"))
+        ret.update(json.dumps(list(job)).encode("utf-8"))
+        for path in deps:
+            ret.update(path.encode("utf-8"))
+            ret.update(str(get_file_digest(path)).encode("utf-8"))
+        return ret.hexdigest()
+    def get_dependents(self, path):
+        """
+        Get the names of the items that used a file in the last build
+        -- path: Path of the file
+        """
+        return self.dependents.get(os.path.normpath(path), [])
+    def get_record_path(self, digest):
+        return os.path.join(self.records_path, digest + ".pickle")
+    def has_record(self, job):
+        """
+        Check if an item can be loaded from the cache, without loading it
+        -- job: (name, seed, trinket) tuple of the item
+        """
+        entry = self.old_items.get(job[0])
+        if entry == None or self.settings != self.old_settings:
+            return False
+        if entry["digest"] != self.get_digest(job, entry["deps"]):
+            return False
+        if not os.path.isfile(self.get_record_path(entry["digest"])):
+            return False
+        # Cached records do not keep their sprite, so their files have to be
+        # left from the last build
+        return all(os.path.isfile(path) for path in entry["outputs"])
+    def get_record(self, job):
+        """
+        Load the cached record of an item
+        Returns None if the record can not be loaded
+        -- job: (name, seed, trinket) tuple of an item that has_record is
+        true for
+        """
+        entry = self.old_items[job[0]]
+        try:
+            with open(self.get_record_path(entry["digest"]), 'rb') as fh:
+                record = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        record.cached = True
+        self.items[job[0]] = entry
+        self.hits += 1
+        return record
+    def add_record(self, job, record):
+        """
+        Add a newly generated item to the manifest and cache its record
+        -- job: (name, seed, trinket) tuple of the item
+        -- record: IsaacItemRecord of the item
+        """
+        digest = self.get_digest(job, record.deps)
+        util.check_folder(self.records_path)
+        record_path = self.get_record_path(digest)
+        with open(record_path + ".tmp", 'wb') as fh:
+            pickle.dump(record.without_image(), fh)
+        os.replace(record_path + ".tmp", record_path)
+        self.items[job[0]] = {
+            "digest": digest,
+            "deps": record.deps,
+            "outputs": record.get_outputs(),
+        }
+        self.misses += 1
+    def save(self):
+        """
+        Remove the outputs and cached records of items that are no longer
+        part of the build, and write out the manifest
+        """
+        outputs = set()
+        digests = set()
+        for entry in self.items.values():
+            outputs.update(entry["outputs"])
+            digests.add(entry["digest"])
+        for entry in self.old_items.values():
+            for path in entry["outputs"]:
+                if not path in outputs and os.path.isfile(path):
+                    os.remove(path)
+        if os.path.isdir(self.records_path):
+            for path in glob.glob(os.path.join(self.records_path, "*.pickle")):
+                if not path_to_digest(path) in digests:
+                    os.remove(path)
+        self.dependents = {}
+        for name, entry in self.items.items():
+            for path in entry["deps"]:
+                if not path in self.dependents:
+                    self.dependents[path] = []
+                self.dependents[path].append(name)
+        util.check_folder(os.path.dirname(self.path))
+        with open(self.path, 'w') as fh:
+            json.dump({
+                "version": CONST_MANIFEST_VERSION,
+                "settings": self.settings,
+                "items": self.items,
+                "dependents": self.dependents,
+            }, fh)
+
+def path_to_digest(path):
+    return os.path.splitext(os.path.basename(path))[0]
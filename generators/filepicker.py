@@ -1,14 +1,19 @@
 from .state import IsaacGenState
-from . import util
+from . import state
 import os
 import random
 import glob
 import math
 import json
 import sys
+import bisect
+import itertools
 
 cached_filepickers = {}
 
+# Number of (hints, exclude) combinations to remember the weights of per folder
+CONST_WEIGHT_CACHE_SIZE = 4096
+
 list_of_hints = []
 
 def path_to_name(path):
@@ -22,6 +27,16 @@ def get_path(path):
     cached_filepickers[path] = ret
     return ret
 
+def forget_folder(path):
+    """
+    Forget a loaded folder, after its files or metadata have changed
+    -- path: Path of the folder
+    """
+    path = os.path.normpath(path)
+    for folder in list(cached_filepickers.keys()):
+        if os.path.normpath(folder) == path:
+            del cached_filepickers[folder]
+
 class PickFile:
     weight = 1.0
     def __init__(self, path, tags):
@@ -32,13 +47,6 @@ class PickFile:
         if not os.path.isfile(path):
             print("Error: No such file {}".format(path))
             sys.exit()
-    def get_weight(self, genstate, total_files):
-        weight = self.weight
-        mult = 1
-        for (hint_name, hint_value) in self.hints.items():
-            hint_mult = hint_value*math.log(total_files+1, 1.25)
-            mult += genstate.get_hint(hint_name)*hint_mult
-        return weight*mult
     def get_path(self):
         return self.path
 
@@ -46,6 +54,7 @@ class PickFolder:
     def __init__(self, path):
         self.path = path
         metafile = os.path.join(path, "meta.json")
+        self.metafile = metafile
         if not os.path.isfile(metafile):
             print("Error: no such metafile {}".format(metafile))
             sys.exit()
@@ -57,19 +66,62 @@ class PickFolder:
             for x in glob.glob(os.path.join(path, "*.*"), recursive=False):
                 if x != metafile and x not in filenames:
                     print("Warning: file {} not defined in metadata.".format(x))
-
-    def choose_random(self):
-        return random.choice(self.files)
-    def choose_random_with_hint(self, genstate, base_weight=3, exclude=[]):
-        weights = {}
+        # Every hint that any file is tagged with, in a fixed order
+        self.hint_names = []
         for filedef in self.files:
-            weight = filedef.get_weight(genstate, len(self.files)-len(exclude))
+            for hint_name in filedef.hints:
+                if not hint_name in self.hint_names:
+                    self.hint_names.append(hint_name)
+        # (index in hint_names, tag value) of each file's tags
+        self.hint_vectors = [[(self.hint_names.index(name), value)\
+                              for name, value in filedef.hints.items()]\
+                             for filedef in self.files]
+        self.hint_slots = [state.get_hint_slot(name) for name in self.hint_names]
+        self.cached_weights = {}
+
+    def get_hint_signature(self, genstate):
+        """
+        Get the values of every hint that files in this folder are tagged with
+        -- genstate: State to get hints from
+        """
+        return tuple(genstate.get_hint_value(slot) for slot in self.hint_slots)
+
+    def get_cumulative_weights(self, signature, exclude):
+        """
+        Get the files that can be picked and their cumulative weights
+        Returns a tuple of (files, cumulative weights)
+        -- signature: Hint values, as returned by get_hint_signature
+        -- exclude: Names of files that can not be picked
+        """
+        key = (signature, frozenset(exclude))
+        if key in self.cached_weights:
+            return self.cached_weights[key]
+        log_factor = math.log(len(self.files)-len(exclude)+1, 1.25)
+        list_items, list_weights = [], []
+        for filedef, vector in zip(self.files, self.hint_vectors):
+            mult = 1
+            for (index, hint_value) in vector:
+                mult += signature[index]*(hint_value*log_factor)
+            weight = filedef.weight*mult
             if weight > 0 and filedef.name not in exclude:
-                weights[filedef] = weight
-        (list_items, list_weights) = util.dict_to_lists(weights)
-        ret = util.choice_weights(list_items, list_weights)
-        if ret == None:
-            print("backupfunc")
-            return self.choose_random()
-        else:
-            return ret
+                list_items.append(filedef)
+                list_weights.append(weight)
+        ret = (list_items, list(itertools.accumulate(list_weights)))
+        if len(self.cached_weights) >= CONST_WEIGHT_CACHE_SIZE:
+            self.cached_weights.clear()
+        self.cached_weights[key] = ret
+        return ret
+
+    def choose_random(self, rng=random):
+        return rng.choice(self.files)
+    def choose_random_with_hint(self, genstate, base_weight=3, exclude=[]):
+        genstate.add_dependency(self.metafile)
+        (list_items, cumulative) = self.get_cumulative_weights(
+            self.get_hint_signature(genstate), exclude)
+        if len(list_items) > 0:
+            pick = genstate.rng.random() * cumulative[-1]
+            index = bisect.bisect_left(cumulative, pick)
+            if index < len(list_items):
+                return list_items[index]
+        print("backupfunc")
+        return self.choose_random(genstate.rng)
@@ -1,7 +1,9 @@
 #!/usr/bin/python3
 from PIL import Image
-from PIL import ImageDraw
 from . import filepicker
+import numpy
+import collections
+import threading
 import glob
 import random
 import os
@@ -56,73 +58,265 @@ SPECIAL_PIXEL_COLORS = {
     # "unused":  [  0, 255, 255, 255],
 }
 
-def test_colors(color, test):
-    """
-    Check if two colors are equal
-    -- color: color to test
-    -- test: other color to test
-    """
-    for i in range(0, 4):
-        if test[i] != color[i]:
-            return False
-    return True
-
-def test_get_pixel_key(color):
-    """
-    Get the keyname for a key color if applicable
-    -- color: color to test
-    """
-    for name, value in SPECIAL_PIXEL_COLORS.items():
-        if test_colors(color, value):
-            return name
-    return None
-
-def test_gradient_color(color):
-    """
-    Check if a color is a palette gradient (blue)
-    -- color: color to test
-    """
-    if color[3] == 255 and color[0] == 0 and color[1] == 0:
-        return True
-    return False
-
-def mult_color(color, mult, alpha):
-    """
-    Multiply two colors together
-    -- color: Color to multiply
-    -- mult: Palette color to multiply color with
-    -- alpha: Alpha scalar
-    """
-    return ((color[0]*mult)//255, (color[1]*mult)//255, (color[2]*mult)//255, color[3]*alpha//255)
-
-def sample_nearby(image, pos):
-    """
-    Get most common color near a pixel
-    image: Image to sample from
-    pos: Position of the pixel
-    """
-    x = pos[0]
-    y = pos[1]
-    colors = {}
-    color_values = {}
-    for ix in range(max(0, x-1), min(x+2, image.width)):
-        for iy in range(max(0, y-1), min(y+2, image.height)):
-            if ix != x or iy != y:
-                color = image.getpixel((ix, iy))
-                # if color[3] > 0:
-                rgba = color[0]*0x01000000 + color[1]*0x00010000\
-                     + color[2]*0x00000100 + color[3]*0x00000001
-                if not rgba in colors:
-                    colors[rgba] = 0
-                    color_values[rgba] = color
-                colors[rgba] += 1
-    highest_count = 0
-    highest_rgba = 0
-    for rgba, count in colors.items():
-        if count > highest_count:
-            highest_count = count
-            highest_rgba = rgba
-    return color_values[highest_rgba]
+def get_key_pixels(pixels):
+    """
+    Find every key-colored pixel in an image array
+    Returns a list of (pos, key) tuples in scanline order
+    -- pixels: RGBA array of the image, shaped (height, width, 4)
+    """
+    keys = numpy.full(pixels.shape[:2], -1, dtype=numpy.int8)
+    names = list(SPECIAL_PIXEL_COLORS.keys())
+    for i, name in enumerate(names):
+        value = numpy.array(SPECIAL_PIXEL_COLORS[name], dtype=numpy.uint8)
+        keys[numpy.all(pixels == value, axis=2)] = i
+    ys, xs = numpy.nonzero(keys >= 0)
+    return [((int(x), int(y)), names[keys[y, x]]) for y, x in zip(ys, xs)]
+
+def get_gradient_mask(pixels):
+    """
+    Get a mask of the pixels which are a palette gradient (blue)
+    -- pixels: RGBA array of the image, shaped (height, width, 4)
+    """
+    return (pixels[:, :, 3] == 255) & (pixels[:, :, 0] == 0) & (pixels[:, :, 1] == 0)
+
+def palettize_gradient(pixels, mask, palette):
+    """
+    Replace gradient pixels with shades of a palette color, in place
+    -- pixels: RGBA array of the image, shaped (height, width, 4)
+    -- mask: Mask of the gradient pixels, as from get_gradient_mask
+    -- palette: Palette color to multiply the gradient with
+    """
+    shade = pixels[mask][:, 2:4].astype(numpy.uint16)
+    mult = numpy.array(palette, dtype=numpy.uint16)
+    recolored = numpy.empty((len(shade), 4), dtype=numpy.uint16)
+    recolored[:, 0:3] = mult[0:3] * shade[:, 0:1] // 255
+    recolored[:, 3] = mult[3] * shade[:, 1] // 255
+    pixels[mask] = recolored.astype(numpy.uint8)
+
+# Decoded parts, indexed by path
+cached_parts = {}
+
+class ImagePart:
+    """
+    A sprite part, decoded once and shared by every sprite that uses it
+    """
+    def __init__(self, path):
+        """
+        Decode a part and index its gradient and key pixels
+        -- path: image path to load from
+        """
+        source = Image.open(path).convert("RGBA")
+        self.path = path
+        self.info = source.info
+        self.pixels = numpy.array(source)
+        self.pixels.flags.writeable = False
+        self.gradient = get_gradient_mask(self.pixels)
+        self.portions = get_key_pixels(self.pixels)
+
+def get_part(path):
+    """
+    Get the decoded part for a path, decoding it if it was not yet loaded
+    -- path: image path to load from
+    """
+    if path in cached_parts:
+        return cached_parts[path]
+    ret = ImagePart(path)
+    cached_parts[path] = ret
+    return ret
+
+def forget_part(path):
+    """
+    Forget a decoded part and its recolors, after it has changed
+    -- path: image path of the part
+    """
+    path = os.path.normpath(path)
+    for part_path in list(cached_parts.keys()):
+        if os.path.normpath(part_path) == path:
+            del cached_parts[part_path]
+            recolor_cache.forget(part_path)
+
+def preload_parts():
+    """
+    Decode every part in the part directories ahead of time
+    """
+    for files in data_files.values():
+        for path in files:
+            get_part(path)
+
+# Neighbours of a pixel, in the order that they are sampled
+CONST_NEARBY = [(x, y) for x in (-1, 0, 1) for y in (-1, 0, 1) if x != 0 or y != 0]
+
+def sample_nearby(pixels, positions):
+    """
+    Get the position of the most common color near each pixel
+    Ties go to the color that was sampled first
+    -- pixels: RGBA array to sample from, shaped (height, width, 4)
+    -- positions: Array of (x, y) positions of the pixels, shaped (n, 2)
+    """
+    height, width = pixels.shape[:2]
+    offsets = numpy.array(CONST_NEARBY)
+    xs = positions[:, 0:1] + offsets[:, 0]
+    ys = positions[:, 1:2] + offsets[:, 1]
+    valid = (xs >= 0) & (ys >= 0) & (xs < width) & (ys < height)
+    xs = xs.clip(0, width-1)
+    ys = ys.clip(0, height-1)
+    # Compare colors as single packed values
+    colors = pixels.view(numpy.uint32)[ys, xs, 0]
+    counts = ((colors[:, :, None] == colors[:, None, :]) & valid[:, None, :]).sum(axis=2)
+    counts[~valid] = -1
+    best = counts.argmax(axis=1)
+    rows = numpy.arange(len(positions))
+    return (xs[rows, best], ys[rows, best])
+
+def remove_key_dots(pixels, portions):
+    """
+    Replace key colors with a sample of nearby colors (by most common), in place
+    Dots are replaced in scanline order, so a dot next to another dot samples
+    the replacement of the earlier dot. Only those are replaced one at a time.
+    -- pixels: RGBA array to remove dots from, shaped (height, width, 4)
+    -- portions: List of (pos, key) tuples of the key pixels
+    """
+    if len(portions) == 0:
+        return
+    positions = numpy.array([pos for (pos, key) in portions])
+    is_dot = numpy.zeros(pixels.shape[:2], dtype=bool)
+    is_dot[positions[:, 1], positions[:, 0]] = True
+    padded = numpy.pad(is_dot, 1)
+    crowded = numpy.zeros(len(positions), dtype=bool)
+    for (x, y) in CONST_NEARBY:
+        crowded |= padded[positions[:, 1]+y+1, positions[:, 0]+x+1]
+    alone = positions[~crowded]
+    (xs, ys) = sample_nearby(pixels, alone)
+    pixels[alone[:, 1], alone[:, 0]] = pixels[ys, xs]
+    for pos in positions[crowded]:
+        (xs, ys) = sample_nearby(pixels, pos[None, :])
+        pixels[pos[1], pos[0]] = pixels[ys[0], xs[0]]
+
+def recolor_part(part, palette):
+    """
+    Recolor a part with a palette color and remove its key dots
+    -- part: Decoded part to recolor
+    -- palette: Palette color to replace the gradient with
+    """
+    pixels = part.pixels.copy()
+    # Palettize blues
+    palettize_gradient(pixels, part.gradient, palette)
+    # Removes annoying dots
+    remove_key_dots(pixels, part.portions)
+    pixels.flags.writeable = False
+    return pixels
+
+def shift_div255(value):
+    """
+    Divide an integer array by 255, the same way as PIL (rounded down)
+    """
+    return ((value >> 8) + value) >> 8
+
+def div255(value):
+    """
+    Divide an integer array by 255, the same way as PIL (rounded)
+    """
+    return shift_div255(value + 0x80)
+
+def composite_part(pixels, part, pos):
+    """
+    Alpha composite a part over an image array, in place
+    The part is masked by its own alpha first, like pasting it onto a
+    transparent image would, so results match PIL exactly
+    -- pixels: RGBA array to composite onto, shaped (height, width, 4)
+    -- part: RGBA array of the part, shaped (height, width, 4)
+    -- pos: Position of the top left corner of the part
+    """
+    height, width = pixels.shape[:2]
+    x0, y0 = max(pos[0], 0), max(pos[1], 0)
+    x1 = min(pos[0] + part.shape[1], width)
+    y1 = min(pos[1] + part.shape[0], height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    src = part[y0-pos[1]:y1-pos[1], x0-pos[0]:x1-pos[0]].astype(numpy.uint32)
+    src = div255(src * src[:, :, 3:4])
+    dst = pixels[y0:y1, x0:x1]
+    src_a = src[:, :, 3:4]
+    dst_a = dst[:, :, 3:4].astype(numpy.uint32)
+    # Same fixed point math as PIL, with 7 bits of precision
+    out_a255 = src_a * 255 + dst_a * (255 - src_a)
+    coef1 = src_a * (255 * 255 * 128) // numpy.maximum(out_a255, 1)
+    coef2 = 255 * 128 - coef1
+    rgb = src[:, :, 0:3] * coef1 + dst[:, :, 0:3] * coef2
+    rgb = shift_div255(rgb + (0x80 << 7)) >> 7
+    blended = numpy.concatenate((rgb, div255(out_a255)), axis=2)
+    visible = src_a[:, :, 0] > 0
+    dst[visible] = blended[visible]
+
+class RecolorCache:
+    """
+    Least-recently-used cache of recolored parts, keyed by (path, palette)
+    """
+    def __init__(self, maxsize):
+        """
+        Create a new cache
+        -- maxsize: Maximum number of recolored parts to keep
+        """
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    def get(self, part, palette):
+        """
+        Get a recolored part, recoloring it if it is not cached
+        The returned array is shared and read-only, copy it before drawing
+        -- part: Decoded part to recolor
+        -- palette: Palette color to replace the gradient with
+        """
+        key = (part.path, palette)
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+        ret = recolor_part(part, palette)
+        with self.lock:
+            if self.maxsize > 0:
+                self.entries[key] = ret
+                self.evict()
+        return ret
+    def forget(self, path):
+        """
+        Remove every recolor of a part
+        -- path: image path of the part
+        """
+        with self.lock:
+            for key in [x for x in self.entries if x[0] == path]:
+                del self.entries[key]
+    def set_maxsize(self, maxsize):
+        """
+        Change the maximum number of recolored parts to keep
+        -- maxsize: Maximum number of recolored parts to keep
+        """
+        with self.lock:
+            self.maxsize = maxsize
+            self.evict()
+    def evict(self):
+        """
+        Remove least recently used parts until the cache fits its size
+        Expects the lock to be held
+        """
+        while len(self.entries) > max(self.maxsize, 0):
+            self.entries.popitem(last=False)
+
+# Every part in every palette is about 1100 entries, which is only a few MB
+RECOLOR_CACHE_SIZE = 1200
+recolor_cache = RecolorCache(RECOLOR_CACHE_SIZE)
+
+def init_worker(recolor_cache_size):
+    """
+    Set up a process that generates items
+    -- recolor_cache_size: Maximum number of recolored parts to keep
+    """
+    recolor_cache.set_maxsize(recolor_cache_size)
+    preload_parts()
 
 def load_part(path, can_face, genstate):
     """
@@ -130,38 +324,21 @@ def load_part(path, can_face, genstate):
     path: image path to load from
     can_face: Does nothing actually
     """
-    palette = random.choice(PALETTE)
-    image = Image.open(path).convert("RGBA")
-    draw = ImageDraw.Draw(image)
-    portions = []
-    # Find key colors and palettize blues
-    for y in range(0, image.height):
-        for x in range(0, image.width):
-            pos = (x, y)
-            color = image.getpixel(pos)
-            replace_key = test_get_pixel_key(color)
-            if replace_key != None:
-                portions.append((pos, replace_key))
-            if test_gradient_color(color):
-                color = mult_color(palette, color[2], color[3])
-                draw.point(pos, color)
-    # Replace key colors with sample of nearby colors (by most common)
-    # Removes annoying dots
-    for data in portions:
-        pos = data[0]
-        repl_color = sample_nearby(image, pos)
-        draw.point(pos, repl_color)
+    genstate.add_dependency(path)
+    palette = genstate.rng.choice(PALETTE)
+    base = get_part(path)
+    pixels = recolor_cache.get(base, palette).copy()
     # paste images on top of graphic
-    for data in portions:
+    for data in base.portions:
         part_pos = data[0]
         part_key = data[1]
         part_x = part_pos[0]
         part_y = part_pos[1]
         part = request_part(part_key, genstate)
         pos = (part_x - part.width//2, part_y - part.height//2)
-        temp = create_image(image.width, image.height)
-        temp.paste(part, pos, part)
-        image = Image.alpha_composite(image, temp)
+        composite_part(pixels, numpy.asarray(part), pos)
+    image = Image.fromarray(pixels, "RGBA")
+    image.info = base.info.copy()
     return image
 
 def request_part(key, genstate):
@@ -192,47 +369,46 @@ CONST_NEAR_TEST = [
     ( 1,  1), ( 1, -1), (-1, -1), (-1,  1),
 ]
 
-def is_pixel_near_pos(image, pos):
-    for val in CONST_NEAR_TEST:
-        x,y = pos[0]+val[0], pos[1]+val[1]
-        if x < 0 or y < 0 or x >= image.width or y >= image.height:
-            continue
-        tpos = (x,y)
-        color = image.getpixel(tpos)
-        if color[3] > 0:
-            return True
-    return False
-
-def outline_image(image):
-    palette = random.choice(PALETTE_BRIGHT)
-    new_image = create_image(image.width, image.height)
-    draw = ImageDraw.Draw(new_image)
-    for y in range(0, image.height):
-        for x in range(0, image.width):
-            pos = (x, y)
-            if is_pixel_near_pos(image, pos):
-                draw.point(pos, palette)
+def get_near_mask(image):
+    """
+    Get a mask of the pixels which have an opaque pixel near them
+    This is a dilation of the alpha channel by CONST_NEAR_TEST
+    -- image: Image to test
+    """
+    opaque = numpy.array(image.getchannel("A")) > 0
+    pad = max(max(abs(x), abs(y)) for (x, y) in CONST_NEAR_TEST)
+    padded = numpy.pad(opaque, pad)
+    ret = numpy.zeros_like(opaque)
+    for (x, y) in CONST_NEAR_TEST:
+        ret |= padded[pad+y:pad+y+image.height, pad+x:pad+x+image.width]
+    return ret
+
+def outline_image(image, rng=random):
+    palette = rng.choice(PALETTE_BRIGHT)
+    outline = numpy.zeros((image.height, image.width, 4), dtype=numpy.uint8)
+    outline[get_near_mask(image)] = palette
+    new_image = Image.fromarray(outline, "RGBA")
     return Image.alpha_composite(new_image, image)
 
 def add_backdrop(image, genstate):
     part = request_part("back", genstate)
     return Image.alpha_composite(part, image)
 
-def generate_image(output, genstate, resize=None):
+def create_random_image(genstate, resize=None):
     """
-    Generate a random image
-    -- name: Name to save image as
+    Create a random image
+    -- genstate: Generator state of the item the image is for
+    -- resize: Size to scale the image to, if any
     """
-    # output = os.path.join(OUTPUT_PATH, name)
     image = request_part("body", genstate)
     outline_chance = 4
     outline_chance += genstate.get_hint("outline")
-    if random.random() < 0.01*outline_chance:
-        image = outline_image(image)
-    if random.random() < 0.25:
+    if genstate.rng.random() < 0.01*outline_chance:
+        image = outline_image(image, genstate.rng)
+    if genstate.rng.random() < 0.25:
         image = add_backdrop(image, genstate)
     if resize:
         if isinstance(resize, list):
             resize = (resize[0], resize[1])
         image = image.resize(resize)
-    image.save(output)
+    return image
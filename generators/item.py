@@ -6,6 +6,7 @@ from . import scriptgen
 from . import util
 import random
 import os
+import copy
 import string
 import json
 from xml.etree import ElementTree
@@ -19,8 +20,8 @@ ANIM_IMAGE_PATH = "700000items/resources/gfx"
 ANIM_BASE_XML_PATH = "generators/script/baseanim.xml"
 POTENTIAL_COSTUMES = [int(x) for x in json.load(open("costumenames.json"))]
 
-def get_random_costume():
-    return random.choice(POTENTIAL_COSTUMES)
+def get_random_costume(rng=random):
+    return rng.choice(POTENTIAL_COSTUMES)
 
 anim_base_xml = open(ANIM_BASE_XML_PATH, 'r').read()
 
@@ -88,6 +89,13 @@ def add_hints_to_poolchances(poolchances, state):
         inc = state.get_hint("pool-"+key)
         poolchances[key] += inc
 
+def gen_definition(functions):
+    """
+    Create the Lua table that defines an item from its fields
+    -- functions: Lua code of each field
+    """
+    return "{\n" + ",".join(functions) + "}\n"
+
 # Value of an item effect
 EFFECT_VALUE = 3
 
@@ -107,6 +115,7 @@ class IsaacItem:
     collision_damage = 0
     costume = None
     familiar_base_hp = 0
+    image = None
     def __init__(self, name, seed, trinket=False, description=None):
         """
         Create a new item
@@ -117,18 +126,18 @@ class IsaacItem:
         # Initialize variables
         self.name = name
         self.seed = seed
+        # Every random choice for this item comes from its own generator
+        self.rng = random.Random(self.seed) if self.seed else random.Random()
         self.stats = IsaacStats()
-        self.genstate = IsaacGenState(self.name)
+        self.genstate = IsaacGenState(self.name, rng=self.rng)
         self.pools = {}
-        self.effect = ""
+        # Fields of the definition that the scripts wrote, in order
+        self.effects = []
+        self.hooks = []
         if trinket:
             self.type = "trinket"
         else:
             self.type = "passive"
-        # Seeding
-        rand_state = random.getstate()
-        if self.seed:
-            random.seed(self.seed)
         # Hints
         self.genstate.parse_hints_from_name(self.name)
         hint_good = self.genstate.get_hint("good")
@@ -144,17 +153,17 @@ class IsaacItem:
         if trinket:
             maximum_value = 3
             minimum_value = 1
-        self.good_value = random.randint(minimum_value, maximum_value) +\
-                          random.randint(0, hint_good)
-        self.bad_value = random.randint(0, hint_bad)
+        self.good_value = self.rng.randint(minimum_value, maximum_value) +\
+                          self.rng.randint(0, hint_good)
+        self.bad_value = self.rng.randint(0, hint_bad)
         # Randomly add bad things to item heh heh heh
         for i in range(0, self.good_value - 2):
-            if random.random() < 0.12:
+            if self.rng.random() < 0.12:
                 self.bad_value += 1
         # Potentially add effect to item
         self._init_effect()
         # If is an active item, remove stats usually
-        if self.type == "active" and random.random() < 0.9:
+        if self.type == "active" and self.rng.random() < 0.9:
             self.good_value = 0
             self.bad_value = 0
         # Create stats
@@ -163,15 +172,12 @@ class IsaacItem:
         self._init_description(description)
         # Pick a costume if necessary
         if trinket == False and self.type == "passive":
-            self.costume = get_random_costume()
-        # Reset random state
-        if self.seed:
-            random.setstate(rand_state)
+            self.costume = get_random_costume(self.rng)
     def _init_stats(self):
         value = self.good_value
         negative_value = self.bad_value
         # Maybe add flying
-        if value >= FLYING_VALUE and random.random() < 0.01:
+        if value >= FLYING_VALUE and self.rng.random() < 0.01:
             self.stats.flying = True
             value -= FLYING_VALUE
         # Apply up to two health upgrades (passives only)
@@ -179,7 +185,7 @@ class IsaacItem:
             hp_chance = self.genstate.get_hint("stat-special")
             for i in range(0, 2):
                 if value >= STAT_SPECIAL_VALUE:
-                    if random.random() < 0.1 * (1 + hp_chance):
+                    if self.rng.random() < 0.1 * (1 + hp_chance):
                         value -= self.stats.add_random_stat_special(self.genstate)
         # Add benefits from value
         self.stats.add_random_stats(value, 1, self.genstate)
@@ -191,7 +197,7 @@ class IsaacItem:
         chance = 0.75
         if is_trinket:
             chance = 0.85
-        if random.random() < chance:
+        if self.rng.random() < chance:
             effect_value = self.add_effect()
             self.good_value -= effect_value
             self.bad_value //= 2
@@ -204,9 +210,9 @@ class IsaacItem:
             pool_chances = get_base_pool_chances()
             add_hints_to_poolchances(pool_chances, self.genstate)
             (pool_names, pool_weights) = util.dict_to_lists(pool_chances)
-            num_pools = max(random.randint(0, 4), random.randint(1, 5))
+            num_pools = max(self.rng.randint(0, 4), self.rng.randint(1, 5))
             for i in range(0, num_pools):
-                pname = util.choice_weights(pool_names, pool_weights)
+                pname = util.choice_weights(pool_names, pool_weights, self.rng)
                 gname = get_greed_name(pname)
                 self.pools[pname] = True
                 if gname != None:
@@ -215,10 +221,10 @@ class IsaacItem:
             self.genstate.parse_hints_from_name("pool-{}".format(pool_name))
     def _init_image(self):
         """
-        Generate and save a random sprite for this item
+        Generate a random sprite for this item, which is kept in self.image
+        until it is written out
         """
-        path = TRINKET_IMAGE_PATH if self.type == "trinket" else OUTPUT_IMAGE_PATH
-        image.generate_image(os.path.join(path,self.get_image_name()), self.genstate)
+        self.image = image.create_random_image(self.genstate)
     def _init_description(self, description=None):
         if description:
             self.description = description
@@ -233,6 +239,12 @@ class IsaacItem:
         name = "".join((c if c in CONST_VALID_PATH_CHARACTERS else "_") for c in self.name.lower())
         base = "trinket" if self.type == "trinket" else "collectible"
         return "{}_{}.png".format(base, name)
+    def get_image_path(self):
+        """
+        Get the path that the image for this item is saved to
+        """
+        path = TRINKET_IMAGE_PATH if self.type == "trinket" else OUTPUT_IMAGE_PATH
+        return os.path.join(path, self.get_image_name())
     def add_effect(self):
         """
         Add a random effect to this item
@@ -250,9 +262,9 @@ class IsaacItem:
             familiar_denom = 1 + familiar_hint
             familiar_chance = familiar_hint / familiar_denom
             # Set type
-            if random.random() < active_chance:
+            if self.rng.random() < active_chance:
                 self.type = "active"
-            elif random.random() < familiar_chance:
+            elif self.rng.random() < familiar_chance:
                 self.type = "familiar"
         # Generate script
         script = None
@@ -266,8 +278,8 @@ class IsaacItem:
             self.familiar_base_hp = script.get_var_default("familiar_base_hp", 0)
         else:
             script = scriptgen.generate_item_active(self.genstate)
-        self.effect += ','
-        self.effect += script.get_output()
+        self.effects += script.output
+        self.hooks += [x for x in script.hooks if not x in self.hooks]
         value = script.get_var_default("value", 0)
 
         # Determine charge value
@@ -278,7 +290,7 @@ class IsaacItem:
             possible_values += [CHARGE_VALUES[expected_id-1]]
         if expected_id+1 < len(CHARGE_VALUES):
             possible_values += [CHARGE_VALUES[expected_id+1]]
-        self.chargeval = random.choice(possible_values)
+        self.chargeval = self.rng.choice(possible_values)
         return value
 
     def get_cacheflags(self):
@@ -304,23 +316,47 @@ class IsaacItem:
         Get a list of item pools this item belongs to
         """
         return util.dict_to_lists(self.pools)[0]
+    def get_functions(self):
+        """
+        Get the fields of the definition for the item, which are mostly
+        functions
+        """
+        return ["\tevaluate_cache = function(self, player, flag)\n{}\nend\n".format(
+            self.stats.gen_eval_cache())] + self.effects
     def get_definition(self):
         """
         Get the definition for the item
         """
-        return "{\n" +\
-        "\tevaluate_cache = function(self, player, flag)\n{}\nend\n".format(\
-            self.stats.gen_eval_cache()) + self.effect +\
-        "}\n"
-    def gen_familiar_xml(self):
+        return gen_definition(self.get_functions())
+    def get_hooks(self):
+        """
+        Get the names of the callbacks this item's definition implements
+        """
+        ret = []
+        if self.stats.gen_eval_cache().strip() != "":
+            ret.append("evaluate_cache")
+        ret += [x for x in self.hooks if not x in ret]
+        return ret
+    def get_familiar_anim(self):
+        """
+        Get the path and contents of the animation file for this familiar
+        Returns None if this item is not a familiar
+        """
         if self.type == "familiar":
-            path = ANIM_IMAGE_PATH
             image_name = self.get_image_name()
             anim_name = "anim_" + image_name +".anm2"
             anim_path = os.path.join(ANIM_IMAGE_PATH, anim_name)
-            with open(anim_path, 'w') as anim_write:
-                local_path = os.path.join("items/collectibles", image_name)
-                anim_write.write(anim_base_xml.replace("$IMAGEPATH", local_path))
+            local_path = os.path.join("items/collectibles", image_name)
+            return (anim_path, anim_base_xml.replace("$IMAGEPATH", local_path))
+        else:
+            return None
+    def create_familiar_xml(self):
+        """
+        Generate the entity XML definition for this familiar
+        Returns None if this item is not a familiar
+        """
+        if self.type == "familiar":
+            anim_name = "anim_" + self.get_image_name() +".anm2"
             xml = ElementTree.Element("entity")
             xml.set("anm2path", anim_name)
             xml.set("baseHP", str(self.familiar_base_hp))
@@ -346,3 +382,79 @@ class IsaacItem:
             return xml
         else:
             return None
+
+class IsaacItemRecord:
+    """
+    The finished output of an item: its XML, script, pools, costume and
+    sprite. Unlike IsaacItem, a record is small and can be sent
+    between processes. The Generator only takes records, not items.
+    """
+    # Loaded from the build cache rather than generated by this build
+    cached = False
+    def __init__(self, item):
+        """
+        Create a record of an item
+        -- item: Item to record
+        """
+        self.name = item.name
+        self.type = item.type
+        self.costume = item.costume
+        self.pools = item.get_pools()
+        self.functions = item.get_functions()
+        self.hooks = item.get_hooks()
+        self.xml = item.gen_xml()
+        self.familiar_anim = item.get_familiar_anim()
+        self.familiar_xml = item.create_familiar_xml()
+        self.image_path = item.get_image_path()
+        self.deps = sorted(item.genstate.deps)
+        self.image = item.image
+    def without_image(self):
+        """
+        Get a copy of this record without its sprite, to keep in the build
+        cache. The sprite of a cached item is already written out.
+        """
+        ret = copy.copy(self)
+        ret.image = None
+        return ret
+    def gen_xml(self):
+        return self.xml
+    def get_pools(self):
+        return self.pools
+    def get_functions(self):
+        return self.functions
+    def get_definition(self):
+        return gen_definition(self.functions)
+    def get_hooks(self):
+        return self.hooks
+    def gen_familiar_xml(self):
+        return self.familiar_xml
+    def get_outputs(self):
+        """
+        Get the paths of every file this item writes out
+        """
+        ret = [self.image_path]
+        if self.familiar_anim != None:
+            ret.append(self.familiar_anim[0])
+        return ret
+    def write_files(self, writer):
+        """
+        Queue the sprite and familiar animation of this item to be written
+        A cached item's files are only written if they are missing
+        -- writer: FileWriter to write with
+        """
+        if self.image != None:
+            if not self.cached or not os.path.isfile(self.image_path):
+                writer.write_image(self.name, self.image_path, self.image)
+        if self.familiar_anim != None:
+            (anim_path, contents) = self.familiar_anim
+            if not self.cached or not os.path.isfile(anim_path):
+                writer.write_text(self.name, anim_path, contents)
+
+def generate_item_record(args):
+    """
+    Generate an item and return its record
+    This is the work function of the process pool used by main
+    -- args: (name, seed, trinket) tuple
+    """
+    (name, seed, trinket) = args
+    return IsaacItemRecord(IsaacItem(name, seed, trinket))
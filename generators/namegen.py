@@ -1,4 +1,5 @@
 import random
+import bisect
 
 genname_adj = []
 genname_pre = []
@@ -24,14 +25,30 @@ load_names_to_list("generators/name/name_post.txt", genname_post);
 load_names_to_list("generators/name/name_pre.txt", genname_pre);
 load_names_to_list("generators/name/name_end.txt", genname_end);
 
-# Count number of possible item names
-possible_item_num = 0
-c_adj = len(genname_adj)
-c_noun = len(genname_adj)
-c_post = len(genname_adj)
-c_pre = len(genname_adj)
-c_end = len(genname_adj)
-for i in range(0, 0x20+1):
+def get_shape_weight(pre, adj, adj2, post, end):
+    """
+    Get how likely generate_name is to make a shape of name, in 63rds
+    generate_name picks pre, adj and post together from 7 equally likely
+    combinations, and a second adjective and end each with 1/3 chance. A
+    second adjective without the first makes a name with one adjective.
+    """
+    if adj2:
+        ret = 1
+    elif adj:
+        ret = 2 + (1 if pre or post else 0)
+    else:
+        ret = 2
+    if end:
+        return ret
+    return ret * 2
+
+# Every shape of name that generate_name can make, as the lists that the words
+# of the name are picked from, in order. A second adjective is only used along
+# with the first, and at least one of pre, adj, or post is always used.
+name_shapes = []
+# Running total of the chance of generate_name making each shape
+name_shape_weights = []
+for i in range(0, 0x20):
     if i & 0x07 != 0:
         _end = i & 0x10 != 0
         _adj2 = i & 0x08 != 0
@@ -40,41 +57,97 @@ for i in range(0, 0x20+1):
         _post = i & 0x01 != 0
         if _adj2 and not _adj:
             continue
-        m = c_noun
-        if _end:
-            m *= c_end
+        shape = []
         if _pre:
-            m *= c_pre
-        if _post:
-            m *= c_post
-        if _adj:
-            m *= c_adj
+            shape.append(genname_pre)
         if _adj2:
-            m *= c_adj
-        possible_item_num += m
+            shape.append(genname_adj)
+        if _adj:
+            shape.append(genname_adj)
+        if _post:
+            shape.append(genname_post)
+        shape.append(genname_noun)
+        if _end:
+            shape.append(genname_end)
+        name_shapes.append(shape)
+        name_shape_weights.append(get_shape_weight(_pre, _adj, _adj2, _post, _end)
+            + (name_shape_weights[-1] if len(name_shape_weights) > 0 else 0))
+
+# Index of the first name of each shape, and number of names of each shape
+name_shape_offsets = []
+name_shape_sizes = []
+# Count number of possible item names
+possible_item_num = 0
+for shape in name_shapes:
+    name_shape_offsets.append(possible_item_num)
+    m = 1
+    for ls in shape:
+        m *= len(ls)
+    name_shape_sizes.append(m)
+    possible_item_num += m
 
 print("{} possible items".format(possible_item_num))
 
-def generate_name():
+def get_name(index):
+    """
+    Get a name by its index
+    Every index in range(possible_item_num) gives a different name
+    -- index: Index of the name
+    """
+    shape = bisect.bisect_right(name_shape_offsets, index) - 1
+    index -= name_shape_offsets[shape]
+    words = []
+    for ls in reversed(name_shapes[shape]):
+        index, i = divmod(index, len(ls))
+        words.append(ls[i])
+    return " ".join(reversed(words))
+
+def sample_names(count, rng=random):
+    """
+    Pick a number of different random names
+    Shapes of names are picked as often as generate_name makes them, and
+    names within a shape are picked without repeating. Once every name of a
+    shape has been picked, another shape is picked instead.
+    -- count: Number of names to pick
+    -- rng: Random number generator to pick with
+    """
+    if count > possible_item_num:
+        raise ValueError("Can not pick more than {} names".format(possible_item_num))
+    shapes = []
+    counts = [0] * len(name_shapes)
+    total = name_shape_weights[-1]
+    for _ in range(count):
+        shape = bisect.bisect_right(name_shape_weights, rng.random() * total)
+        while counts[shape] >= name_shape_sizes[shape]:
+            shape = bisect.bisect_right(name_shape_weights, rng.random() * total)
+        counts[shape] += 1
+        shapes.append(shape)
+    indices = [rng.sample(range(size), num)
+               for (size, num) in zip(name_shape_sizes, counts)]
+    return [get_name(name_shape_offsets[shape] + indices[shape].pop())
+            for shape in shapes]
+
+def generate_name(rng=random):
     """
     Generate a random name for an item
+    -- rng: Random number generator to generate the name with
     """
-    flags = random.randint(1, 7)
-    do_end = random.randint(1, 3) == 1
-    do_adj2 = random.randint(1, 3) == 1
-    ret = random.choice(genname_noun)
+    flags = rng.randint(1, 7)
+    do_end = rng.randint(1, 3) == 1
+    do_adj2 = rng.randint(1, 3) == 1
+    ret = rng.choice(genname_noun)
     if flags & 0x4: # Post
-        post = random.choice(genname_post)
+        post = rng.choice(genname_post)
         ret = post + " " + ret
     if flags & 0x2: # Adj
-        adj = random.choice(genname_adj)
+        adj = rng.choice(genname_adj)
         ret = adj + " " + ret
     if do_adj2: # Adj
-        adj = random.choice(genname_adj)
+        adj = rng.choice(genname_adj)
         ret = adj + " " + ret
     if flags & 0x1: # Pre
-        pre = random.choice(genname_pre)
+        pre = rng.choice(genname_pre)
         ret = pre + " " + ret
     if do_end: # End
-        ret = ret + " " + random.choice(genname_end)
+        ret = ret + " " + rng.choice(genname_end)
     return ret
@@ -4,7 +4,7 @@ self.creep_time = self.creep_time and self.creep_time - 1 or 0
 if self.creep_time <= 0 then
     self.creep_time = 4
     local id = python[[
-gen.writeln("{}".format(choose_random_effect_common()))
+gen.writeln("{}".format(choose_random_effect_common(gen.rng)))
     ]]
     local entity = Isaac.Spawn(EntityType.ENTITY_EFFECT, id, 0, pos, Vector(0,0), nil)
     local effect = entity:ToEffect()
@@ -31,7 +31,7 @@ do
     for enemy in pairs(_enemies) do
         python[[
 duration = 2
-damage = "{:.2f}*player.Damage".format(random.uniform(0.4, 0.7))
+damage = "{:.2f}*player.Damage".format(gen.rng.uniform(0.4, 0.7))
 VALID_STATUS = [
     ("Poison", "AddPoison(EntityRef(player), {0}, {1})"),
     ("Slow", "AddSlowing(EntityRef(player), {0}, 0.5, Color(0.5, 0.5, 0.5, 1.0, 0, 0, 0))--{1}"),
@@ -41,7 +41,7 @@ VALID_STATUS = [
     ("Burn", "AddBurn(EntityRef(player), {0}, {1})"),
     ("Shrink", "AddShrink(EntityRef(player), {0})--{1}"),
 ]
-status = random.choice(VALID_STATUS)
+status = gen.rng.choice(VALID_STATUS)
 gen.writeln("enemy:" + status[1].format(duration, damage))
 gen.genstate.add_descriptor(status[0].title())
         ]]
@@ -1,8 +1,8 @@
 python[[gen.genstate.add_descriptors(["Status"])]]
 python[[
 base_chance = 8
-duration = random.randint(20, 40)
-damage = random.uniform(0.5, 2.0)
+duration = gen.rng.randint(20, 40)
+damage = gen.rng.uniform(0.5, 2.0)
 VALID_STATUS = [
     ("Poison", "AddPoison(EntityRef(player), {0}, {1:.2f})"),
     ("Freeze", "AddFreeze(EntityRef(player), {0})--{1}"),
@@ -13,7 +13,7 @@ VALID_STATUS = [
     ("Burn", "AddBurn(EntityRef(player), {0}, {1:.2f})"),
     ("Shrink", "AddShrink(EntityRef(player), {0})--{1}"),
 ]
-status = random.choice(VALID_STATUS)
+status = gen.rng.choice(VALID_STATUS)
 if status[0] == "Freeze":
     duration //= 2
     base_chance += 2
@@ -4,7 +4,7 @@ python[[gen.chance(5, 0.3, 1)]]
     local game = Game()
     python[[
 FART_TYPES = [1, 1, 1, 2, 2, 3]
-fart = random.choice(FART_TYPES)
+fart = gen.rng.choice(FART_TYPES)
 if fart == 1:
     gen.writeln("game:Fart(pos, 48, nil, 1, 0)")
 elif fart == 2:
@@ -3,7 +3,7 @@ python[[gen.inc_var("value", 1)]]
 python[[gen.chance(9, 0.5, 2)]]
 do
     local id = python[[
-gen.writeln("{}".format(choose_random_effect_rare()))
+gen.writeln("{}".format(choose_random_effect_rare(gen.rng)))
     ]]
     local entity = Isaac.Spawn(EntityType.ENTITY_EFFECT, id, 0, pos, Vector(0,0), nil)
     -- local effect = entity:ToEffect()
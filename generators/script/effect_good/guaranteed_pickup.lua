@@ -3,7 +3,7 @@ python[[gen.genstate.add_descriptors(["Drops", "Gives"])]]
 do
 	local pickup, subtype = python[[
 pickup = choose_random_pickup(gen.genstate)
-subtype = choose_random_pickup_subtype(pickup)
+subtype = choose_random_pickup_subtype(pickup, gen.rng)
 pickup_name = get_pickup_name(pickup)
 gen.writeln("{}, {}".format(pickup_name, subtype))
 gen.genstate.add_descriptor(pickup.title())
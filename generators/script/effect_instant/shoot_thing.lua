@@ -8,7 +8,7 @@ POSSIBLE_SHOOTS = [
     ("Tech", "player:FireTechLaser({0}, LaserOffset.LASER_TECH1_OFFSET, {1}, true, false)"),
     ("Tech X", "player:FireTechXLaser({0}, {1}, 32)"),
 ]
-shooty = random.choice(POSSIBLE_SHOOTS)
+shooty = gen.rng.choice(POSSIBLE_SHOOTS)
 gen.writeln(shooty[1].format("pos", "player:GetLastDirection() * 8 * player.ShotSpeed"))
 gen.genstate.add_descriptor(shooty[0].title())
 ]]
@@ -1,7 +1,7 @@
 python[[gen.genstate.add_descriptors(["Gross", "Trail", "Creep", "Slime", "Liquid"])]]
 do
     local id = python[[
-gen.writeln("{}".format(choose_random_effect_common()))
+gen.writeln("{}".format(choose_random_effect_common(gen.rng)))
     ]]
     for i = 1, 10 do
         local pos = pos + Vector(1, 0):Rotated(math.random()*360)*math.sqrt(math.random())*80
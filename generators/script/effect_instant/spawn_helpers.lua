@@ -2,7 +2,7 @@ if source and source.Type == 3 and (source.Variant == 43 or source.Variant == 73
 	return
 end
 python[[
-if random.random() < 0.4:
+if gen.rng.random() < 0.4:
     gen.writeln("player:AddBlueSpider(pos)")
     gen.genstate.add_descriptors(["Spider"])
 else:
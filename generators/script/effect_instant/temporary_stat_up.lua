@@ -7,7 +7,7 @@ room_change = function(self, player)
 end
 """)
 stats = IsaacStats()
-value = random.randint(2, 3)
+value = gen.rng.randint(2, 3)
 gen.inc_var("value", value)
 stats.add_random_stats(value, 1, gen.genstate)
 gen.write_effect("\ttemp_stats = function(self, player, flag)\n{}\nend\n".format(\
@@ -9,7 +9,7 @@ do
             local tear = familiar:FireProjectile(dir)
             python[[
 gen.include("familiar_tear")
-if random.random() < 0.3:
+if gen.rng.random() < 0.3:
     gen.include("familiar_tear")
             ]]
         end
@@ -1,6 +1,6 @@
 do
     local dir = player:GetAimDirection()
-    local speed = python[[gen.write(random.choice([5, 6, 7, 8]))]]
+    local speed = python[[gen.write(gen.rng.choice([5, 6, 7, 8]))]]
     if dir.X ~= 0 or dir.Y ~= 0 then
         dir = dir:Normalized()
     end
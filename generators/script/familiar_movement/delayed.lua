@@ -1,7 +1,7 @@
 
 do
     local length = python[[
-length = random.choice([30, 45, 60, 75, 90])
+length = gen.rng.choice([30, 45, 60, 75, 90])
 gen.write(length)
 gen.write_effect("""
 familiar_init = function(self, player, familiar)
@@ -1 +1 @@
-familiar:MoveDiagonally(python[[gen.write(random.choice([0.5,0.75,1]))]])
+familiar:MoveDiagonally(python[[gen.write(gen.rng.choice([0.5,0.75,1]))]])
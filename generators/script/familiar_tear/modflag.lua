@@ -1,7 +1,7 @@
 python[[
 for i in range(3):
-    if i == 0 or random.random() < 0.2:
-        effect = choose_random_tearflag();
+    if i == 0 or gen.rng.random() < 0.2:
+        effect = choose_random_tearflag(gen.rng);
         chance = get_tearflag_chance(effect)
         color = get_tearflag_color(effect)
         variant = get_tearflag_variant(effect)
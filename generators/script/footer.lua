@@ -1,24 +1,101 @@
-for i, name in pairs(Mod.item_names) do
-	local id = Isaac.GetItemIdByName(name)
-	local def = Mod.items[id] or Mod.items[name] or {}
+-- The game gives out ids in the order that things are in the XML files, so
+-- every id follows from the first one, as long as the last one agrees.
+-- Otherwise each id is looked up by name.
+-- Returns the list of ids, and the first id if they are in order
+local function get_ids(names, get_id)
+	local ids = {}
+	if #names == 0 then return ids end
+	local first = get_id(names[1])
+	if first and first >= 0 and get_id(names[#names]) == first + #names - 1 then
+		for i = 1, #names do
+			ids[i] = first + i - 1
+		end
+		return ids, first
+	end
+	for i, name in ipairs(names) do
+		ids[i] = get_id(name)
+	end
+	return ids
+end
+
+local item_base_id
+Mod.item_ids, item_base_id = get_ids(Mod.item_names, Isaac.GetItemIdByName)
+local item_positions = {}
+if not item_base_id then
+	for i, id in ipairs(Mod.item_ids) do
+		item_positions[id] = i
+	end
+end
+-- Get the position of an item in Mod.item_names from its id
+local function get_item_position(id)
+	if type(id) ~= "number" then return nil end
+	if not item_base_id then return item_positions[id] end
+	local i = id - item_base_id + 1
+	if i >= 1 and i <= #Mod.item_ids then return i end
+end
+
+local familiar_variants = {}
+local familiar_positions = {}
+for _, i in ipairs(Mod.familiar_items) do
+	local name = Mod.item_names[i]
+	local familiar_variant = Isaac.GetEntityVariantByName(name)
+	if familiar_variant and familiar_variant >= 0 then
+		Isaac.DebugString(("Item \"%s\" has familiar variant %d"):format(name, familiar_variant))
+		familiar_variants[i] = familiar_variant
+		familiar_positions[familiar_variant] = i
+	end
+end
+
+local function init_item(i, def)
+	local id = Mod.item_ids[i]
 	Mod.items[id] = def
-	Mod.items[name] = def
 
-	def.item_name = name
+	def.item_name = Mod.item_names[i]
 	def.item_id = id
 
 	if def.init then def:init() end
 
-	table.insert(Mod.item_ids, id)
-
-	local familiar_variant = Isaac.GetEntityVariantByName(name)
-	if familiar_variant and familiar_variant >= 0 then
-		Isaac.DebugString(("Item \"%s\" has familiar variant %d"):format(name, familiar_variant))
+	local familiar_variant = familiar_variants[i]
+	if familiar_variant then
 		Mod.familiars[familiar_variant] = def
 		def.familiar_variant = familiar_variant
 	end
+	return def
+end
+
+for i, name in ipairs(Mod.item_names) do
+	-- Items with a loader are created the first time they are looked up
+	if not Mod.item_loaders[name] then
+		local def = Mod.items[name] or {}
+		Mod.items[name] = nil
+		init_item(i, def)
+	end
 end
 
+setmetatable(Mod.items, {
+	__index = function(items, key)
+		if type(key) == "string" then
+			local def = items[Isaac.GetItemIdByName(key)]
+			rawset(items, key, def)
+			return def
+		end
+		local i = get_item_position(key)
+		if not i then return nil end
+		local name = Mod.item_names[i]
+		local loader = Mod.item_loaders[name]
+		if not loader then return nil end
+		Mod.item_loaders[name] = nil
+		Isaac.DebugString(("Loaded item \"%s\"!"):format(name))
+		return init_item(i, loader())
+	end
+})
+setmetatable(Mod.familiars, {
+	__index = function(familiars, variant)
+		local i = familiar_positions[variant]
+		return i and Mod.items[Mod.item_ids[i]]
+	end
+})
+
 Mod.card_names = {}
 for name, func in pairs(Mod.cards) do
 	table.insert(Mod.card_names, name)
@@ -28,22 +105,31 @@ for _, name in ipairs(Mod.card_names) do
 	Mod.cards[id] = Mod.cards[name]
 end
 
-Mod.pill_names = {}
-for name, func in pairs(Mod.pills) do
-	table.insert(Mod.pill_names, name)
+local pill_ids = get_ids(Mod.pill_names, Isaac.GetPillEffectByName)
+for i, name in ipairs(Mod.pill_names) do
+	Mod.pills[pill_ids[i]] = Mod.pills[name]
+	Mod.pills[name] = nil
 end
-for _, name in ipairs(Mod.pill_names) do
-	local id = Isaac.GetPillEffectByName(name)
-	Mod.pills[id] = Mod.pills[name]
+
+local trinket_ids = get_ids(Mod.trinket_names, Isaac.GetTrinketIdByName)
+for i, name in ipairs(Mod.trinket_names) do
+	Mod.trinkets[trinket_ids[i]] = Mod.trinkets[name]
+	Mod.trinkets[name] = nil
 end
 
-Mod.trinket_names = {}
-for name, def in pairs(Mod.trinkets) do
-	table.insert(Mod.trinket_names, name)
+-- Only items and trinkets that implement a callback are called for it
+for func, positions in pairs(Mod.item_hooks) do
+	for _, i in ipairs(positions) do
+		local id = Mod.item_ids[i]
+		Mod.item_hook_ids[id] = Mod.item_hook_ids[id] or {}
+		table.insert(Mod.item_hook_ids[id], func)
+	end
 end
-for _, name in ipairs(Mod.trinket_names) do
-	local id = Isaac.GetTrinketIdByName(name)
-	Mod.trinkets[id] = Mod.trinkets[name]
+for func, positions in pairs(Mod.trinket_hooks) do
+	Mod.trinket_hook_ids[func] = {}
+	for _, i in ipairs(positions) do
+		Mod.trinket_hook_ids[func][trinket_ids[i]] = true
+	end
 end
 
 load_data()
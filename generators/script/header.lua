@@ -131,12 +131,41 @@ local function _get_player_items(id)
 	if not _player_items[id] then
 		_player_items[id] = {
 			potential = {},
-			list = {}
+			list = {},
+			-- item ids the player has, by the callbacks they implement
+			hooks = {},
+			-- number of collectibles and active item when last checked
+			count = -1,
+			active = 0,
+			-- whether items may have been added without being picked up
+			changed = true
 		}
 	end
 	return _player_items[id]
 end
 
+local function _add_player_item(player_items, item_id)
+	player_items.list[item_id] = true
+	for _, func in ipairs(Mod.item_hook_ids[item_id] or {}) do
+		local ids = player_items.hooks[func]
+		if not ids then
+			ids = {}
+			player_items.hooks[func] = ids
+		end
+		ids[item_id] = true
+	end
+end
+
+local function _remove_player_item(player_items, item_id)
+	player_items.list[item_id] = nil
+	for _, func in ipairs(Mod.item_hook_ids[item_id] or {}) do
+		local ids = player_items.hooks[func]
+		if ids then
+			ids[item_id] = nil
+		end
+	end
+end
+
 local function _signal_refresh_cache(id)
 	local player = type(id) == "number" and Isaac.GetPlayer(id) or id
 	player:AddCacheFlags(CacheFlag.CACHE_ALL)
@@ -167,41 +196,123 @@ local function try_remove_costume(player, name)
 	end
 end
 
+local function _item_added(i, player, item_id, picked_up)
+	_add_player_item(_get_player_items(i), item_id)
+	local item_def = Mod.items[item_id]
+	if picked_up then
+		Isaac.DebugString(("Added item %d!"):format(item_id))
+		_signal_refresh_cache(i-1)
+		if item_def.on_pickup then
+			item_def:on_pickup(player)
+		end
+	end
+	if item_def.on_add then
+		item_def:on_add(player)
+	end
+	try_add_costume(player, item_def.item_name)
+end
+
+-- remove items that the player does not have
+local function _remove_missing_items(i, player)
+	local player_items = _get_player_items(i)
+	for item_id in pairs(player_items.list) do
+		if not player:HasCollectible(item_id) then
+			local item_def = Mod.items[item_id]
+			if item_def.on_remove then
+				item_def:on_remove(player)
+			end
+			try_remove_costume(player, item_def.item_name)
+			_remove_player_item(player_items, item_id)
+			Isaac.DebugString(("Removed item %d!"):format(item_id))
+			_signal_refresh_cache(i-1)
+		end
+	end
+end
+
 -- Completely refreshing the cache is a slow operation that may take a second
--- Use conservatively!
-local function _refresh_item_cache()
+-- Use conservatively! Only players whose items may have changed without
+-- picking anything up are refreshed, unless all is set.
+local function _refresh_item_cache(all)
 	local game = Game()
 	for i = 1, game:GetNumPlayers() do
 		local player_items = _get_player_items(i);
 		local player = game:GetPlayer(i-1);
-		-- player_items.list = {}
-		player_items.potential = {}
-		for _, item_id in pairs(Mod.item_ids) do
-			if player:HasCollectible(item_id) and not player_items.list[item_id] then
-				player_items.list[item_id] = true
-				local item_def = Mod.items[item_id]
-				if item_def.on_add then
-					item_def:on_add(player)
+		if all or player_items.changed then
+			player_items.changed = false
+			player_items.count = player:GetCollectibleCount()
+			player_items.active = player:GetActiveItem()
+			_remove_missing_items(i, player)
+			for _, item_id in pairs(Mod.item_ids) do
+				if player:HasCollectible(item_id) and not player_items.list[item_id] then
+					_item_added(i, player, item_id, false)
 				end
-				try_add_costume(player, item_def.item_name)
 			end
+			_signal_refresh_cache(i-1)
+			Isaac.DebugString("Refreshed Item Cache")
 		end
-		_signal_refresh_cache(i-1)
 	end
-	Isaac.DebugString("Refreshed Item Cache")
+end
+
+-- Look for items that the player picked up or lost, but only when the number
+-- of collectibles they have or their active item changes
+local function _check_player_items(i, player)
+	local player_items = _get_player_items(i)
+	local count = player:GetCollectibleCount()
+	local active = player:GetActiveItem()
+	if count == player_items.count and active == player_items.active then
+		return
+	end
+	-- collectibles gained that no pedestal accounts for
+	local unexplained = count - player_items.count
+	player_items.count = count
+	player_items.active = active
+	_remove_missing_items(i, player)
+	for item_id in pairs(player_items.potential) do
+		if player:HasCollectible(item_id) then
+			player_items.potential[item_id] = nil
+			unexplained = unexplained - 1
+			if not player_items.list[item_id] and Mod.items[item_id] then
+				_item_added(i, player, item_id, true)
+			end
+		end
+	end
+	if active ~= 0 and not player_items.list[active] and Mod.items[active] then
+		_item_added(i, player, active, true)
+	end
+	if unexplained > 0 then
+		-- Something else gave the player an item, which is looked for when
+		-- the room changes
+		player_items.changed = true
+	end
+end
+
+-- Mark every player's items as possibly changed
+local function _signal_items_changed()
+	for i = 1, Game():GetNumPlayers() do
+		_get_player_items(i).changed = true
+	end
 end
 
 --[[
 Per-Item data, such as: stats, item variants, functionality, etc.
 --]]
 Mod.items = {} -- Item Data (indexable by name and id)
+Mod.item_loaders = {} -- functions that create item data not created yet, by name
+Mod.shared_functions = {} -- functions that several items have in common
 Mod.item_names = {} -- List of item names
-Mod.item_ids = {} -- List of item ids (unordered)
+Mod.item_ids = {} -- List of item ids, in the same order as item_names
+Mod.familiar_items = {} -- positions in item_names of the familiar items
 Mod.cards = {} -- list of cards
 Mod.pills = {} -- list of pills
+Mod.pill_names = {} -- list of pill names, in the order of pocketitems.xml
 Mod.trinkets = {} -- list of trinkets
+Mod.trinket_names = {} -- list of trinket names, in the order of items.xml
 Mod.familiars = {} -- list of familiars.
 -- Keys are integers referring to Variant, and values are item def
+Mod.item_hooks = {} -- positions of the items that implement each callback
+Mod.trinket_hooks = {} -- positions of the trinkets that implement each callback
+Mod.item_hook_ids = {} -- callbacks that each item id implements
+Mod.trinket_hook_ids = {} -- trinket ids that implement each callback
 
 function Mod:get_player_id(player)
 	local game = Game()
@@ -218,17 +329,21 @@ end
 -- call a callback for a specific player
 function Mod:call_callbacks(player_id, func, ...)
 	player_id, player = Mod:get_player_id(player_id)
-	local item_ids = _get_player_items(player_id).list
-	for item_id in pairs(item_ids) do
-		local item_def = Mod.items[item_id]
-		local item_func = item_def[func]
-		if item_func then
-			item_func(item_def, player, ...)
+	local item_ids = _get_player_items(player_id).hooks[func]
+	if item_ids then
+		for item_id in pairs(item_ids) do
+			local item_def = Mod.items[item_id]
+			local item_func = item_def[func]
+			if item_func then
+				item_func(item_def, player, ...)
+			end
 		end
 	end
+	local trinket_ids = Mod.trinket_hook_ids[func]
+	if not trinket_ids then return end
 	for i = 1, player:GetMaxTrinkets() do
 		local trinket_id = player:GetTrinket(i-1)
-		local trinket_def = Mod.trinkets[trinket_id]
+		local trinket_def = trinket_ids[trinket_id] and Mod.trinkets[trinket_id]
 		if trinket_def then
 			local trinket_func = trinket_def[func]
 			if trinket_func then
@@ -294,15 +409,38 @@ function Mod.callbacks:evaluate_cache(player, flag)
 	player.MaxFireDelay = math.max(minimum_tears, player.MaxFireDelay)
 end
 
+-- Active items that change the player's items without changing how many
+-- there are
+local REROLL_ITEMS = {
+	[CollectibleType.COLLECTIBLE_D4] = true,
+	[CollectibleType.COLLECTIBLE_D100] = true,
+	[CollectibleType.COLLECTIBLE_D_INFINITY] = true,
+}
+
+local _killers = {}
+-- Whether every player's items are refreshed on the next update
+local _refresh_pending = false
 function Mod.callbacks:room_change()
-	_refresh_item_cache()
+	local game = Game()
+	for i = 1, game:GetNumPlayers() do
+		_get_player_items(i).potential = {}
+	end
+	if game:GetRoom():GetType() == RoomType.ROOM_DICE then
+		_signal_items_changed()
+	end
+	_refresh_item_cache(false)
 	Mod.args.damage_taken = 0
 	Mod.args.damage_dealt = 0
 	Mod:call_callbacks_all("room_change")
 	_killers = {}
 end
 
+function Mod.callbacks:new_level()
+	_signal_items_changed()
+end
+
 function Mod.callbacks:game_started(is_savestate)
+	_refresh_item_cache(true)
 	if is_savestate then
 		load_data()
 		Mod:call_callbacks_all("room_change")
@@ -329,7 +467,6 @@ function Mod.callbacks:pre_game_end(should_save)
 end
 
 local _room_id = -1
-local _killers = {}
 local _timer = 0
 local _timerf = 0
 function Mod.callbacks:update()
@@ -337,82 +474,47 @@ function Mod.callbacks:update()
 	_timer = game:GetFrameCount()
 	_timerf = _timer / 30
 
-	-- remove items that the player does not have
+	if _refresh_pending then
+		_refresh_pending = false
+		_refresh_item_cache(false)
+	end
 	for i = 1, game:GetNumPlayers() do
-		local list = _get_player_items(i).list;
-		local player = game:GetPlayer(i-1);
-		local item_i = 1
-		for item_id in pairs(list) do
-			if not player:HasCollectible(item_id) then
-				local item_def = Mod.items[item_id]
-				if item_def.on_remove then
-					item_def:on_remove(player)
-				end
-				try_remove_costume(player, item_def.item_name)
-				list[item_id] = nil
-				Isaac.DebugString(("Removed item %d!"):format(item_id))
-				_signal_refresh_cache(i-1)
-			end
-		end
+		_check_player_items(i, game:GetPlayer(i-1))
 	end
 
-	-- add items to list of potential items
-	for _, entity in pairs(Isaac.GetRoomEntities()) do
-		local item_id = entity.SubType
-		if entity.Type == EntityType.ENTITY_PICKUP
-		and entity.Variant == PickupVariant.PICKUP_COLLECTIBLE
-		and Mod.items[item_id] then
-			for i = 1, game:GetNumPlayers() do
-				local player_items = _get_player_items(i)
-				if player_items.list[item_id] == nil then
-					if player_items.potential[item_id] == nil then
-						Isaac.DebugString(("Added potential item %d!"):format(item_id))
-					end
-					player_items.potential[item_id] = 100
-				end
-			end
-		end
-	end
+	Mod:call_callbacks_all("update", _timer, _timerf)
+end
 
-	-- track potential items and see if player picked them up
+-- A pedestal of an item from this mod appeared, which any player might pick up
+function Mod.callbacks:pickup_init(pickup)
+	local item_id = pickup.SubType
+	if not Mod.items[item_id] then return end
+	local game = Game()
 	for i = 1, game:GetNumPlayers() do
 		local player_items = _get_player_items(i)
-		local player = game:GetPlayer(i-1)
-		for item_id in pairs(player_items.potential) do
-			if player:HasCollectible(item_id) then
-				player_items.list[item_id] = true
-				player_items.potential[item_id] = nil
-				Isaac.DebugString(("Added item %d!"):format(item_id))
-				_signal_refresh_cache(i-1)
-				local item_def = Mod.items[item_id]
-				if item_def.on_pickup then
-					item_def:on_pickup(player)
-				end
-				if item_def.on_add then
-					item_def:on_add(player)
-				end
-				try_add_costume(player, item_def.item_name)
-			else
-				player_items.potential[item_id] = player_items.potential[item_id] - 1
-				if player_items.potential[item_id] <= 0 then
-					player_items.potential[item_id] = nil
-					Isaac.DebugString(("Removed potential item %d!"):format(item_id))
-				end
+		if player_items.list[item_id] == nil then
+			if player_items.potential[item_id] == nil then
+				Isaac.DebugString(("Added potential item %d!"):format(item_id))
 			end
+			player_items.potential[item_id] = true
 		end
 	end
+end
 
-	-- check for dead enemies
-	for id, def in pairs(_killers) do
-		local entity = def.Entity
-		if not entity:Exists() then
-			_killers[id] = nil
-			local enemy = entity:ToNPC()
-			Mod:call_callbacks(Isaac.GetPlayer(0), "enemy_died", enemy, _killers[id])
-		end
-	end
+-- A player touched a pedestal, whose item may have changed since it appeared
+function Mod.callbacks:pickup_collision(pickup, collider, low)
+	local player = collider:ToPlayer()
+	if not player or pickup.SubType == 0 then return end
+	if player:HasCollectible(pickup.SubType) then return end
+	local player_id = Mod:get_player_id(player)
+	_get_player_items(player_id).potential[pickup.SubType] = true
+end
 
-	Mod:call_callbacks_all("update", _timer, _timerf)
+function Mod.callbacks:entity_kill(entity)
+	local killer = _killers[entity.Index]
+	if not killer then return end
+	_killers[entity.Index] = nil
+	Mod:call_callbacks(Isaac.GetPlayer(0), "enemy_died", entity:ToNPC(), killer)
 end
 
 function Mod.callbacks:render()
@@ -438,6 +540,12 @@ function Mod.callbacks:render()
 end
 
 function Mod.callbacks:use_item(item, rng)
+	if REROLL_ITEMS[item] then
+		-- Rerolled items keep the number of items the same, so they would
+		-- not be noticed until the room changes
+		_signal_items_changed()
+		_refresh_pending = true
+	end
 	local item_def = Mod.items[item]
 	if item_def and item_def.on_usage then
 		local ret = item_def:on_usage(Isaac.GetPlayer(0), rng)
@@ -523,7 +631,11 @@ Mod:AddCallback(ModCallbacks.MC_USE_PILL, Mod.callbacks.use_pill)
 Mod:AddCallback(ModCallbacks.MC_FAMILIAR_INIT, Mod.callbacks.familiar_init)
 Mod:AddCallback(ModCallbacks.MC_FAMILIAR_UPDATE, Mod.callbacks.familiar_update)
 Mod:AddCallback(ModCallbacks.MC_POST_NEW_ROOM, Mod.callbacks.room_change)
+Mod:AddCallback(ModCallbacks.MC_POST_NEW_LEVEL, Mod.callbacks.new_level)
 Mod:AddCallback(ModCallbacks.MC_POST_GAME_STARTED, Mod.callbacks.game_started)
+Mod:AddCallback(ModCallbacks.MC_POST_PICKUP_INIT, Mod.callbacks.pickup_init, PickupVariant.PICKUP_COLLECTIBLE)
+Mod:AddCallback(ModCallbacks.MC_PRE_PICKUP_COLLISION, Mod.callbacks.pickup_collision, PickupVariant.PICKUP_COLLECTIBLE)
+Mod:AddCallback(ModCallbacks.MC_POST_ENTITY_KILL, Mod.callbacks.entity_kill)
 Mod:AddCallback(ModCallbacks.MC_POST_GAME_END, Mod.callbacks.game_end)
 Mod:AddCallback(ModCallbacks.MC_PRE_GAME_EXIT, Mod.callbacks.pre_game_end)
 
@@ -2,7 +2,7 @@ local player = Isaac.GetPlayer(0)
 local pos = player.Position
 local self = {}
 python[[
-num = random.random()
+num = gen.rng.random()
 gen.set_allow_random(False)
 if num <= 0.125:
 	#12% chance really good
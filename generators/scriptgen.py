@@ -4,6 +4,7 @@ from . import util
 import os
 import random
 import glob
+import re
 
 CONST_ACTIVE_ITEM_IDS = [
     # Only relevant items which wouldn't suck as an effect (e.g. no kamikaze)
@@ -256,23 +257,23 @@ CONST_COLLECTIBLES_DISABLE_TIMER = [
 CONST_COLLECTIBLES_TIMER = [x for x in CONST_COLLECTIBLES
     if x not in CONST_COLLECTIBLES_DISABLE_TIMER]
 
-def choose_random_active():
-    return random.choice(CONST_ACTIVE_ITEM_IDS)
+def choose_random_active(rng=random):
+    return rng.choice(CONST_ACTIVE_ITEM_IDS)
 
-def choose_random_effect_common():
-    return random.choice(CONST_EFFECT_TYPES_COMMON)
+def choose_random_effect_common(rng=random):
+    return rng.choice(CONST_EFFECT_TYPES_COMMON)
 
-def choose_random_effect_rare():
-    return random.choice(CONST_EFFECT_TYPES_RARE)
+def choose_random_effect_rare(rng=random):
+    return rng.choice(CONST_EFFECT_TYPES_RARE)
 
-def choose_random_collectible(is_timer):
+def choose_random_collectible(is_timer, rng=random):
     if is_timer:
-        return random.choice(CONST_COLLECTIBLES_TIMER)
+        return rng.choice(CONST_COLLECTIBLES_TIMER)
     else:
-        return random.choice(CONST_COLLECTIBLES)
+        return rng.choice(CONST_COLLECTIBLES)
 
-def choose_random_tearflag():
-    return random.choice(CONST_TEARFLAGS)
+def choose_random_tearflag(rng=random):
+    return rng.choice(CONST_TEARFLAGS)
 
 def get_tearflag_chance(flagname):
     if flagname in CONST_TEARFLAG_CHANCES:
@@ -295,12 +296,12 @@ def id_to_descriptors(item_id):
 def does_effect_need_velocity(name):
     return name == "EffectVariant.SHOCKWAVE_DIRECTIONAL"
 
-def choose_random_pickup_subtype(name):
+def choose_random_pickup_subtype(name, rng=random):
     if name in CONST_PICKUP_SUBTYPES:
-        if random.random() < 0.50:
+        if rng.random() < 0.50:
             return "0"
         else:
-            return random.choice(CONST_PICKUP_SUBTYPES[name])
+            return rng.choice(CONST_PICKUP_SUBTYPES[name])
     else:
         return "0"
 
@@ -309,14 +310,15 @@ def choose_random_pickup(genstate):
     for name in CONST_PICKUP_VARIANTS_LIST:
         choices.append(name)
         weights.append(1+genstate.get_hint("pickup-{}".format(name)))
-    return util.choice_weights(choices, weights)
+    return util.choice_weights(choices, weights, genstate.rng)
 
 def get_pickup_name(name):
     return CONST_PICKUP_VARIANTS[name]
 
 def load_file(fname, genstate):
-    with open(fname, 'r') as fh:
-        return load_string(fh.read(), genstate, fname)
+    sb = ScriptBuilder(genstate)
+    sb.parse_file_to_output(fname)
+    return sb
 
 def load_string(string, genstate, fname):
     sb = ScriptBuilder(genstate);
@@ -346,13 +348,67 @@ CONST_PYTHON_END = "]]"
 CONST_PYTHON_BEGIN_LEN = len(CONST_PYTHON_BEGIN)
 CONST_PYTHON_END_LEN = len(CONST_PYTHON_END)
 CONST_GEN_PATH = "generators/script/"
+# Matches the name of the function that an effect defines
+CONST_HOOK_PATTERN = re.compile(r"\s*(\w+)\s*=\s*function\b")
+
+def compile_template(string, fname):
+    """
+    Split a template into the chunks of text and compiled python[[ ]]
+    blocks that it is made of
+    Returns a list of (text, code) tuples, where code is a code object, the
+    SyntaxError raised while compiling the block, or None after the last text
+    -- string: Contents of the template
+    -- fname: Name of the template file, used when reporting errors
+    """
+    chunks = []
+    pos = 0
+    while pos < len(string):
+        python_pos_start = string.find(CONST_PYTHON_BEGIN, pos)
+        python_pos_end = string.find(CONST_PYTHON_END, pos)
+        if python_pos_start == -1 or python_pos_end == -1:
+            chunks.append((string[pos:], None))
+            break
+        append_string = string[pos:python_pos_start]
+        python_string = string[python_pos_start+CONST_PYTHON_BEGIN_LEN:python_pos_end]
+        try:
+            code = compile(python_string, fname, "exec")
+        except SyntaxError as err:
+            code = err
+        chunks.append((append_string, code))
+        pos = python_pos_end+CONST_PYTHON_END_LEN
+    return chunks
+
+cached_templates = {}
+def get_template(fname):
+    """
+    Get the compiled chunks of a template file, reading it only once
+    -- fname: Path of the template file
+    """
+    if not fname in cached_templates:
+        with open(fname, 'r') as fh:
+            cached_templates[fname] = compile_template(fh.read(), fname)
+    return cached_templates[fname]
+
+def forget_template(fname):
+    """
+    Forget the compiled chunks of a template, after it has changed
+    -- fname: Path of the template file
+    """
+    fname = os.path.normpath(fname)
+    for path in list(cached_templates.keys()):
+        if os.path.normpath(path) == fname:
+            del cached_templates[path]
 
 class ScriptBuilder:
     def __init__(self, genstate):
         self.output = []
-        self.buffer = ""
+        # Names of the functions defined by the effects, in order
+        self.hooks = []
+        # Chunks of text written since the last effect, joined only once
+        self.buffer = []
         self.data = {}
         self.genstate = genstate
+        self.rng = genstate.rng
         self.allow_random = True
     def set_allow_random(self, value):
         self.allow_random = value
@@ -371,58 +427,59 @@ class ScriptBuilder:
         else:
             return other
     def parse_file(self, fname):
-        with open(fname, 'r') as fh:
-            self.parse(fh.read(), fname)
+        self.buffer = []
+        self.genstate.add_dependency(fname)
+        self.run_template(get_template(fname), fname)
     def parse_file_to_output(self, fname):
         self.parse_file(fname)
-        self.write_effect(self.buffer)
-        self.buffer = ""
+        self.flush_buffer()
     def parse(self, string, fname):
-        self.buffer = ""
-        while len(string) > 0:
-            if CONST_PYTHON_BEGIN in string and CONST_PYTHON_END in string:
-                # Find positions
-                python_pos_start = string.find(CONST_PYTHON_BEGIN)
-                python_pos_end = string.find(CONST_PYTHON_END)
-                # Get string splits
-                append_string = string[:python_pos_start]
-                python_string = string[python_pos_start+CONST_PYTHON_BEGIN_LEN:python_pos_end]
-                string = string[python_pos_end+CONST_PYTHON_END_LEN:]
-                # Append strings
-                self.write(append_string)
-                try:
-                    exec(python_string, globals(), {
-                        "gen": self
-                    })
-                except Exception as err:
-                    print(err)
-                    print("Occurred in file {}!".format(fname))
-            else:
-                self.write(string)
-                string = ""
+        self.buffer = []
+        self.run_template(compile_template(string, fname), fname)
+    def run_template(self, chunks, fname):
+        for append_string, code in chunks:
+            self.write(append_string)
+            if code == None:
+                continue
+            try:
+                if isinstance(code, SyntaxError):
+                    raise code
+                exec(code, globals(), {
+                    "gen": self
+                })
+            except Exception as err:
+                print(err)
+                print("Occurred in file {}!".format(fname))
     def parse_to_output(self, string, fname):
         self.parse(string, fname)
-        self.write_effect(self.buffer)
-        self.buffer = ""
+        self.flush_buffer()
+    def flush_buffer(self):
+        self.write_effect("".join(self.buffer))
+        self.buffer = []
     def write(self, string):
-        self.buffer += str(string)
+        self.buffer.append(str(string))
     def get_hint(self, name):
         return self.genstate.get_hint(name)
     def add_hint(self, name, value):
         self.genstate.add_hint(name, value)
     def writeln(self, string):
-        self.buffer += str(string) + "\n"
+        self.buffer.append(str(string))
+        self.buffer.append("\n")
     def write_effect(self, string):
-        self.output.append(str(string))
+        string = str(string)
+        match = CONST_HOOK_PATTERN.match(string)
+        if match and not match.group(1) in self.hooks:
+            self.hooks.append(match.group(1))
+        self.output.append(string)
     def include(self, fname, exclude=[]):
         if os.path.isfile(fname):
             # result = load_file(fname, self.genstate)
             # self.writeln(result.get_output())
             # for key, value in result.data.items():
             #     self.set_var(key, value)
-            pbuffer = self.buffer
-            self.parse_file(fname)
-            self.buffer = pbuffer + self.buffer
+            # Included text carries on in the same buffer
+            self.genstate.add_dependency(fname)
+            self.run_template(get_template(fname), fname)
             return filepicker.path_to_name(fname)
         elif os.path.isdir(fname):
             picker = filepicker.get_path(fname)
@@ -0,0 +1,123 @@
+import re
+import hashlib
+
+# Brief rundown of shared functions:
+# Many items end up with functions that are the same, or only differ in the
+# numbers they use. Numbers are taken out of each function to get its shape,
+# and the second time a shape is seen it is written once to
+# Mod.shared_functions. Items then use that function instead of their own
+# copy. Functions with numbers in them are shared as a function that takes
+# the numbers and returns the item's function, with the numbers as upvalues.
+
+# Tokens of Lua code that numbers need to be told apart from
+CONST_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--\[(?P<ceq>=*)\[.*?\](?P=ceq)\]|--[^\n]*)
+    |(?P<longstring>\[(?P<seq>=*)\[.*?\](?P=seq)\])
+    |(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<number>0[xX][0-9a-fA-F]+|\d+\.?\d*(?:[eE][-+]?\d+)?)
+""", re.S | re.X)
+# Matches a field of an item definition that is set to a function
+CONST_FIELD_PATTERN = re.compile(r"(\s*(?:\w+\s*=\s*)?)(function\b.*?)(\s*)$", re.S)
+# Keywords that open and close blocks
+CONST_BLOCK_OPEN = {"function", "if", "do", "repeat"}
+CONST_BLOCK_CLOSE = {"end", "until"}
+# Functions with more numbers than this are not shared, since Lua limits the
+# number of arguments a function can have
+CONST_MAX_CONSTANTS = 60
+CONST_CONSTANT_NAME = "__c{}"
+
+def split_constants(code):
+    """
+    Take the numbers out of a Lua function
+    Returns the function with the numbers replaced by arguments and the list
+    of numbers, or None if the code is not a single function
+    -- code: Code of the function
+    """
+    ret = []
+    constants = []
+    depth = 0
+    pos = 0
+    for match in CONST_TOKEN_PATTERN.finditer(code):
+        if depth == 0 and pos != 0:
+            # Something follows the end of the function
+            return None
+        kind = match.lastgroup
+        if kind == "name":
+            if match.group() in CONST_BLOCK_OPEN:
+                depth += 1
+            elif match.group() in CONST_BLOCK_CLOSE:
+                depth -= 1
+        elif kind == "number":
+            if code[match.start()-1] == ".":
+                # Numbers like .5 can not be told apart from field names
+                return None
+            constants.append(match.group())
+            ret.append(code[pos:match.start()])
+            ret.append(CONST_CONSTANT_NAME.format(len(constants)))
+            pos = match.end()
+            continue
+        ret.append(code[pos:match.end()])
+        pos = match.end()
+    if depth != 0 or code[pos:].strip() != "":
+        return None
+    return ("".join(ret), constants)
+
+class SharedFunctions:
+    """
+    Writes functions that several items have in common to the script once,
+    and replaces them in each item with the shared function
+    """
+    def __init__(self, script):
+        """
+        Create a new table of shared functions
+        -- script: File to write the shared functions to
+        """
+        self.lua_script = script
+        # Index of every function shape seen, or None if it was only seen once
+        self.shapes = {}
+        self.count = 0
+        self.functions = 0
+        self.replaced = 0
+        self.bytes_saved = 0
+    def share(self, field):
+        """
+        Replace a function with a shared one, if it has been seen before
+        Returns the new code of the field
+        -- field: Lua code of a function, or of a table field set to one
+        """
+        match = CONST_FIELD_PATTERN.match(field)
+        if match == None:
+            return field
+        (prefix, code, suffix) = match.groups()
+        split = split_constants(code)
+        if split == None or len(split[1]) > CONST_MAX_CONSTANTS:
+            return field
+        (shape, constants) = split
+        self.functions += 1
+        digest = hashlib.blake2b(shape.encode("utf-8"), digest_size=16).digest()
+        if not digest in self.shapes:
+            self.shapes[digest] = None
+            return field
+        index = self.shapes[digest]
+        if index == None:
+            self.count += 1
+            index = self.count
+            self.shapes[digest] = index
+            self.write_function(index, shape, len(constants))
+        ret = "Mod.shared_functions[{}]".format(index)
+        if len(constants) > 0:
+            ret += "({})".format(", ".join(constants))
+        self.replaced += 1
+        self.bytes_saved += len(code) - len(ret)
+        return prefix + ret + suffix
+    def write_function(self, index, shape, num_constants):
+        if num_constants == 0:
+            text = "Mod.shared_functions[{}] = {}\n".format(index, shape)
+        else:
+            args = ", ".join(CONST_CONSTANT_NAME.format(i+1)
+                             for i in range(num_constants))
+            text = "Mod.shared_functions[{}] = function({}) return {}\nend\n".format(
+                index, args, shape)
+        self.bytes_saved -= len(text)
+        self.lua_script.write(text)
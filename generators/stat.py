@@ -1,5 +1,6 @@
 import random
 from . import util
+from .state import get_hint_slot
 from xml.etree import ElementTree
 
 # Common stats
@@ -90,44 +91,45 @@ def genStatStr(flagstr, propertystr, op, value):
     "\t\t\t" + operation.format(flagstr, propertystr, op, value) + "\n" +\
     "\t\tend\n"
 
-def generate_random_stat_special(statname):
+def generate_random_stat_special(statname, rng=random):
     """
     Generate a random value for a given special stat upgrade
     -- statname: Name of the stat to generate a value for
+    -- rng: Random number generator to generate the value with
     """
     values = STAT_RANGES_SPECIAL[statname]
     a = values[0]
     b = values[1]
     if statname == "health":
         return 2
-    return random.randint(a, b)
+    return rng.randint(a, b)
+
+# Hint slots that add to the weight of each stat
+STAT_HINT_SLOTS_SPECIAL = [get_hint_slot("stat-"+x) for x in
+    ["health", "spirit", "black"]]
+STAT_HINT_SLOTS = [get_hint_slot("stat-"+x) for x in
+    ["speed", "luck", "tears", "shotspeed", "damage", "range"]]
 
 def pick_random_stat_special(state):
-    weights = [x for x in STAT_WEIGHTS_SPECIAL]
-    weights[0] += state.get_hint("stat-health") # HP
-    weights[1] += state.get_hint("stat-spirit") # Spirit hearts
-    weights[2] += state.get_hint("stat-black") # Black hearts
-    return util.choice_weights(STAT_NAMES_SPECIAL, weights)
+    weights = [x + state.get_hint_value(slot) for x, slot in
+        zip(STAT_WEIGHTS_SPECIAL, STAT_HINT_SLOTS_SPECIAL)]
+    return util.choice_weights(STAT_NAMES_SPECIAL, weights, state.rng)
 
 def pick_random_stat(is_good, state):
     weights = None
     if is_good:
-        weights = [x for x in STAT_WEIGHTS]
-        weights[0] += state.get_hint("stat-speed") # Speed
-        weights[1] += state.get_hint("stat-luck") # Luck
-        weights[2] += state.get_hint("stat-tears") # Tears
-        weights[3] += state.get_hint("stat-shotspeed") # ShotSpeed
-        weights[4] += state.get_hint("stat-damage") # Damage
-        weights[5] += state.get_hint("stat-range") # Range
+        weights = [x + state.get_hint_value(slot) for x, slot in
+            zip(STAT_WEIGHTS, STAT_HINT_SLOTS)]
     else:
         weights = STAT_WEIGHTS_BAD
-    return util.choice_weights(STAT_NAMES, weights)
+    return util.choice_weights(STAT_NAMES, weights, state.rng)
 
-def generate_random_stat(statname, value):
+def generate_random_stat(statname, value, rng=random):
     """
     Generate a random value for a given stat upgrade
     -- statname: Name of the stat to generate a value for
     -- value: How highly valued the stat being generated is
+    -- rng: Random number generator to generate the value with
     Higher value = higher returned stats
     """
     a_value = STAT_RANGES[statname] * value
@@ -137,9 +139,9 @@ def generate_random_stat(statname, value):
     if statname == "luck":
         return a_value
     elif isinstance(a_value, int):
-        return random.randint(a_value, b_value)
+        return rng.randint(a_value, b_value)
     else:
-        return round(random.uniform(a_value, b_value), 2)
+        return round(rng.uniform(a_value, b_value), 2)
 
 def updown(value):
     return "Up" if value > 0 else "Down"
@@ -184,8 +186,8 @@ class IsaacStats:
         Returns how much of the maxvalue was taken
         """
         stat_name = pick_random_stat_special(genstate)
-        stat_inc = generate_random_stat_special(stat_name)
-        self.increment_stat(stat_name, stat_inc)
+        stat_inc = generate_random_stat_special(stat_name, genstate.rng)
+        self.increment_stat(stat_name, stat_inc, genstate.rng)
         return STAT_SPECIAL_VALUE
     def add_random_stat(self, maxvalue, multiplier, genstate):
         """
@@ -198,15 +200,16 @@ class IsaacStats:
         stat_name = pick_random_stat(multiplier > 0, genstate)
         if stat_name == "luck":
             maxvalue = min(2, maxvalue)
-        take_value = random.randint(1, maxvalue)
-        stat_inc = generate_random_stat(stat_name, take_value)*multiplier
-        self.increment_stat(stat_name, stat_inc)
+        take_value = genstate.rng.randint(1, maxvalue)
+        stat_inc = generate_random_stat(stat_name, take_value, genstate.rng)*multiplier
+        self.increment_stat(stat_name, stat_inc, genstate.rng)
         return take_value
-    def increment_stat(self, stat, value):
+    def increment_stat(self, stat, value, rng=random):
         """
         Add a value to a stat
         -- stat: Name of the stat to modify
         -- value: How much to modify the stat by
+        -- rng: Random number generator for how much health heals
         """
         if stat == "speed":
             self.speed += value
@@ -223,7 +226,7 @@ class IsaacStats:
         elif stat == "health":
             self.hearts += value
             for i in range(0, value):
-                if random.randint(1, 6) != 1:
+                if rng.randint(1, 6) != 1:
                     self.heal += 1
         elif stat == "soul":
             self.hearts_spirit += value
@@ -316,10 +319,10 @@ class IsaacStats:
         if len(ret) >= 3:
             ret.append("All Stats Up")
         return ret
-    def add_random_weapon(self):
+    def add_random_weapon(self, rng=random):
         # Weapons are not implemented yet, this will come in the future
         # There is not currently a way to do this
-        self.weapon = random.choice(CONST_WEAPONS)
+        self.weapon = rng.choice(CONST_WEAPONS)
     def gen_is_stat_capped(self):
         ret = ""
         if self.tears != 0:
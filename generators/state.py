@@ -1,7 +1,16 @@
 import random
+import os
 
 hint_def = {}
 _current_hint_names = []
+cached_hint_matcher = None
+
+# Every hint name is interned to a slot, which indexes the hint values of a
+# generator state
+hint_slots = {}
+hint_slot_names = []
+# Words of the name-* hints, by slot
+name_hint_words = {}
 
 # Brief rundown of hints:
 # In order to add a semblence of sanity to this mod, item effects, stats, and
@@ -27,6 +36,8 @@ def add_hint_value(name, key, value):
     -- key: Name of the value that is modified by this hint
     -- value: How much the value is modified by this hint
     """
+    global cached_hint_matcher
+    cached_hint_matcher = None
     add_hint_def(name)
     if not key in hint_def[name]:
         hint_def[name][key] = 0
@@ -64,6 +75,99 @@ with open('generators/hints.txt') as fh:
 
             for name in name_list:
                 add_hint_value(name, hint_name, hint_value)
+
+def get_hint_slot(name):
+    """
+    Get the slot of a hint, interning it if it is new
+    -- name: Name of the hint
+    """
+    if not name in hint_slots:
+        hint_slots[name] = len(hint_slot_names)
+        hint_slot_names.append(name)
+        if name.startswith("name-"):
+            name_hint_words[hint_slots[name]] = name[5:]
+    return hint_slots[name]
+
+class HintMatcher:
+    """
+    Finds every hint match in a name in a single pass (Aho-Corasick)
+    """
+    def __init__(self, hint_def):
+        """
+        Build the matcher
+        -- hint_def: Dictionary of match names to the hints they apply
+        """
+        self.patterns = list(hint_def.keys())
+        self.hint_lists = list(hint_def.values())
+        # Transitions, failure links and matched patterns of each state
+        self.goto = [{}]
+        self.fail = [0]
+        self.matches = [[]]
+        for index, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                if not char in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.matches.append([])
+                    self.goto[node][char] = len(self.goto)-1
+                node = self.goto[node][char]
+            self.matches[node].append(index)
+        # Breadth-first, so that failure links always point to finished states
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                fail = self.fail[node]
+                while fail != 0 and not char in self.goto[fail]:
+                    fail = self.fail[fail]
+                if char in self.goto[fail] and self.goto[fail][char] != child:
+                    fail = self.goto[fail][char]
+                self.fail[child] = fail
+                self.matches[child] = self.matches[child] + self.matches[fail]
+                queue.append(child)
+        self.cached_deltas = {}
+    def find(self, text):
+        """
+        Get the indices of every pattern found in text, in pattern order
+        -- text: Text to search
+        """
+        found = set(self.matches[0])
+        node = 0
+        for char in text:
+            while node != 0 and not char in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            found.update(self.matches[node])
+        return tuple(sorted(found))
+    def get_deltas(self, text):
+        """
+        Get the summed hint values of every pattern found in text
+        Returns a list of (hint slot, value) tuples
+        -- text: Text to search
+        """
+        found = self.find(text)
+        if not found in self.cached_deltas:
+            deltas = {}
+            for index in found:
+                for hint_name, hint_value in self.hint_lists[index].items():
+                    slot = get_hint_slot(hint_name)
+                    deltas[slot] = deltas.get(slot, 0) + hint_value
+            self.cached_deltas[found] = list(deltas.items())
+        return self.cached_deltas[found]
+
+def get_hint_matcher():
+    """
+    Get the matcher for the global hint definition
+    """
+    global cached_hint_matcher
+    if cached_hint_matcher == None:
+        cached_hint_matcher = HintMatcher(hint_def)
+    return cached_hint_matcher
+
+for hints in hint_def.values():
+    for hint_name in hints:
+        get_hint_slot(hint_name)
+
 def debug_hints():
     """
     Print out all hint values
@@ -91,44 +195,83 @@ class IsaacGenState:
     Represents the state of an item generator
     Currently only deals with hints
     """
-    def __init__(self, item_name, hints=None):
+    __slots__ = ("rng", "values", "name", "name_lower", "effect",
+                 "extra_descriptors", "deps")
+    def __init__(self, item_name, hints=None, rng=None):
         """
         Create a new generator state
+        -- item_name: Name of the item being generated
+        -- hints: Initial hint values
+        -- rng: Random number generator for this item, shared by everything
+        that generates it. Uses the global random state if not given.
         """
-        if hints == None:
-            hints = {}
-        self.hints = hints
+        if rng == None:
+            rng = random
+        self.rng = rng
         self.name = item_name
         self.name_lower = self.name.lower()
         self.effect = ""
-        self.descriptors = CONST_BASE_DESCRIPTORS.copy()
+        # Paths of every file used to generate this item
+        self.deps = set()
+        # Hint values by slot; name-* hints are only worked out once
+        self.values = []
+        self._grow_values()
+        if hints != None:
+            for name, value in hints.items():
+                self.add_hint(name, value)
+        # Descriptors on top of CONST_BASE_DESCRIPTORS
+        self.extra_descriptors = []
         for value in CONST_RARE_DESCRIPTORS:
-            if random.random() < 0.3:
-                self.descriptors.append(value)
-    def _check_hint(self, name):
+            if self.rng.random() < 0.3:
+                self.extra_descriptors.append(value)
+    def _grow_values(self):
+        """
+        Make room for hints that were interned after this state was created
+        """
+        for slot in range(len(self.values), len(hint_slot_names)):
+            if slot in name_hint_words:
+                self.values.append(1 if self.check_name_hint(name_hint_words[slot]) else 0)
+            else:
+                self.values.append(0)
+    def get_hint_value(self, slot):
         """
-        make sure a hint exists
-        -- name: name of the hint to check
+        Get the value of the hint in a given slot
+        -- slot: slot of the hint, from get_hint_slot
         """
-        if not name in self.hints:
-            self.hints[name] = 0
+        if slot >= len(self.values):
+            self._grow_values()
+        return self.values[slot]
     def get_hint(self, name):
         """
         Get the value of a given hint
         -- name: name of the hint
         """
-        if name.startswith("name-"):
-            return 1 if self.check_name_hint(name[5:]) else 0
-        self._check_hint(name)
-        return self.hints[name]
+        return self.get_hint_value(get_hint_slot(name))
+    def add_hint_value(self, slot, value):
+        """
+        Add a value to the hint in a given slot
+        name-* hints only depend on the name, and can not be added to
+        -- slot: slot of the hint, from get_hint_slot
+        -- value: value to add to the hint
+        """
+        if slot in name_hint_words:
+            return
+        if slot >= len(self.values):
+            self._grow_values()
+        self.values[slot] += value
     def add_hint(self, name, value):
         """
         Add a value to a hint
         -- name: name of the hint
         -- value: value to add to the hint
         """
-        self._check_hint(name)
-        self.hints[name] += value
+        self.add_hint_value(get_hint_slot(name), value)
+    def add_dependency(self, path):
+        """
+        Record that a file was used to generate this item
+        -- path: Path of the file
+        """
+        self.deps.add(os.path.normpath(path))
     def check_name_hint(self, word):
         # if word in self.name_lower:
         #     # print("Match {} in {}".format(word, self.name))
@@ -140,24 +283,23 @@ class IsaacGenState:
         Parse hints out of a name using hint matches
         -- name: name to search for hints
         """
-        for match_name, hint_list in hint_def.items():
-            if match_name in name.lower():
-                for hint_name, hint_value in hint_list.items():
-                    self.add_hint(hint_name, hint_value)
+        for slot, hint_value in get_hint_matcher().get_deltas(name.lower()):
+            self.add_hint_value(slot, hint_value)
         # for word in [x.lower() for x in name.split()]:
         #     self.add_hint("name-{}".format(word), 1)
     def add_descriptor(self, desc, value=1):
-        self.descriptors += [desc] * value
+        self.extra_descriptors += [desc] * value
     def add_descriptors(self, ls, value=1):
-        self.descriptors += ls * value
+        self.extra_descriptors += ls * value
     def gen_description(self):
-        ls = random.sample(self.descriptors, random.randint(2, 6))
+        descriptors = CONST_BASE_DESCRIPTORS + self.extra_descriptors
+        ls = self.rng.sample(descriptors, self.rng.randint(2, 6))
         ret = ls[0]
         for s in ls[1:]:
             space = " "
-            if random.random() < 0.08:
-                space = random.choice(CONST_WEIRD_COMBINERS)
+            if self.rng.random() < 0.08:
+                space = self.rng.choice(CONST_WEIRD_COMBINERS)
             ret += "{}{}".format(space, s)
-        if random.random() < 0.12:
-            ret += random.choice(CONST_ENDINGS)
+        if self.rng.random() < 0.12:
+            ret += self.rng.choice(CONST_ENDINGS)
         return ret
@@ -1,6 +1,9 @@
 import random
 import os
+import hashlib
 TARGET_FOLDER = "700000items"
+# Cache of the last build, used to only regenerate items that changed
+CACHE_FOLDER = "700000items-cache"
 
 def get_output_path(dir):
     """
@@ -27,23 +30,35 @@ def dict_to_lists(dict):
         retb.append(value)
     return (reta, retb)
 
-def choice_weights(choices, weights):
+def choice_weights(choices, weights, rng=random):
     """
     Pick a random item from choices given a list of weights for each item
     -- choices: A choice that can be chosen
     -- weights: The weights that correspond to each choice
+    -- rng: Random number generator to pick with
     """
     total = sum(weights)
-    rng = random.random() * total
+    pick = rng.random() * total
     i = 0
     for i in range(0, len(choices)):
         weight = weights[i]
         name = choices[i]
-        rng -= weight
-        if rng <= 0:
+        pick -= weight
+        if pick <= 0:
             return name
         i += 1
 
+def get_seed(name, master_seed=""):
+    """
+    Get the seed for a name
+    Unlike hash(), this is the same in every process and on every machine
+    -- name: Name to get the seed of
+    -- master_seed: Seed of the whole build, which is mixed into every seed
+    """
+    key = hashlib.blake2b(str(master_seed).encode("utf-8"), digest_size=32).digest()
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8, key=key).digest()
+    return int.from_bytes(digest, "big")
+
 def generate_lua_function(arguments, code):
     if not type(code) is list and not type(code) is tuple:
         code = [code]
@@ -0,0 +1,220 @@
+import io
+import os
+import glob
+import numpy
+import shutil
+import hashlib
+from PIL import Image
+import threading
+import concurrent.futures
+
+# Number of threads that encode and write files
+WRITER_THREADS = min(8, os.cpu_count() or 1)
+# Number of files that can be waiting to be written before adding another
+# one blocks, which keeps the memory used by queued sprites bounded
+WRITER_MAX_PENDING = 256
+# zlib compression level of PNGs, from 0 (none) to 9 (smallest)
+PNG_COMPRESS_LEVEL = 6
+
+class FileWriter:
+    """
+    Encodes and writes out files on a pool of background threads, so that
+    generating items does not wait on compression or the filesystem
+    """
+    def __init__(self, threads=WRITER_THREADS, max_pending=WRITER_MAX_PENDING,
+                 indexed=False, compress_level=PNG_COMPRESS_LEVEL,
+                 store_path=None):
+        """
+        Create a new writer
+        -- threads: Number of threads to write with
+        -- max_pending: Number of files that can be queued at once
+        -- indexed: Write sprites as palettized PNGs where they have few
+        enough colors
+        -- compress_level: zlib compression level of PNGs
+        -- store_path: Folder to keep one copy of every distinct file in.
+        Files are hardlinked to their copy in the store, so identical files
+        only take up space once. If None, every file is written on its own.
+        """
+        self.store_path = store_path
+        if store_path != None and not os.path.isdir(store_path):
+            os.makedirs(store_path)
+        # Digests of the distinct files written, and bytes written in total
+        # and for distinct files only
+        self.blobs = set()
+        # Files written through the store, and how many of them had to be
+        # copied because they could not be linked
+        self.stored = 0
+        self.copied = 0
+        self.total_bytes = 0
+        self.unique_bytes = 0
+        self.indexed = indexed
+        self.compress_level = compress_level
+        # Bytes saved by writing indexed PNGs instead of RGBA ones
+        self.bytes_saved = 0
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Condition()
+        self.queued = 0
+        self.errors = []
+        self.written = 0
+    def submit(self, name, path, func, *args, dedup=True):
+        """
+        Queue a file to be written, waiting if too many files are queued
+        -- name: Name of the item the file belongs to, for error messages
+        -- path: Path of the file
+        -- func: Function that returns the contents of the file as bytes
+        -- args: Arguments to func
+        -- dedup: Write the file through the store, if there is one
+        """
+        self.pending.acquire()
+        with self.lock:
+            self.queued += 1
+        self.executor.submit(self._write, name, path, func, args, dedup)
+    def _write(self, name, path, func, args, dedup):
+        try:
+            data = func(*args)
+            if dedup and self.store_path != None:
+                self._write_linked(path, data)
+            else:
+                # Replace the file instead of writing into it, since it may
+                # be a link to a file in the store of an earlier build
+                with open(path + ".tmp", 'wb') as fh:
+                    fh.write(data)
+                os.replace(path + ".tmp", path)
+            with self.lock:
+                self.written += 1
+        except Exception as err:
+            with self.lock:
+                self.errors.append((name, path, err))
+        finally:
+            with self.lock:
+                self.queued -= 1
+                self.lock.notify_all()
+            self.pending.release()
+    def _write_linked(self, path, data):
+        """
+        Write a file as a hardlink to its copy in the store, or as a copy of
+        it if the filesystem can not link
+        """
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        blob = os.path.join(self.store_path, digest)
+        with self.lock:
+            self.stored += 1
+            self.total_bytes += len(data)
+            if not digest in self.blobs:
+                self.blobs.add(digest)
+                self.unique_bytes += len(data)
+        if not os.path.isfile(blob):
+            temp = "{}.{}".format(blob, threading.get_ident())
+            with open(temp, 'wb') as fh:
+                fh.write(data)
+            os.replace(temp, blob)
+        elif os.path.isfile(path) and os.path.samefile(path, blob):
+            # Already linked, and renaming a link over itself does nothing
+            return
+        temp = path + ".tmp"
+        try:
+            os.link(blob, temp)
+        except OSError:
+            shutil.copyfile(blob, temp)
+            with self.lock:
+                self.copied += 1
+        os.replace(temp, path)
+    def get_dedup_ratio(self):
+        """
+        Get the number of bytes written for every byte stored
+        """
+        if self.unique_bytes == 0:
+            return 1.0
+        return self.total_bytes / self.unique_bytes
+    def prune_store(self):
+        """
+        Remove files from the store which are no longer linked to any output
+        Files written by this writer are kept even if they are not linked,
+        since outputs are copies of them where links are not supported
+        """
+        if self.store_path == None:
+            return
+        for path in glob.glob(os.path.join(self.store_path, "*")):
+            if os.path.basename(path) in self.blobs:
+                continue
+            if os.stat(path).st_nlink <= 1:
+                os.remove(path)
+    def write_image(self, name, path, image):
+        """
+        Queue a sprite to be encoded as PNG and written
+        -- name: Name of the item the sprite belongs to
+        -- path: Path to write the sprite to
+        -- image: Sprite to write
+        """
+        self.submit(name, path, self._encode_image, image)
+    def _encode_image(self, image):
+        data = encode_png(image, self.compress_level)
+        if self.indexed:
+            indexed = encode_png_indexed(image, self.compress_level)
+            if indexed != None and len(indexed) < len(data):
+                with self.lock:
+                    self.bytes_saved += len(data) - len(indexed)
+                data = indexed
+        return data
+    def write_text(self, name, path, text):
+        """
+        Queue a text file to be written
+        -- name: Name of the item the file belongs to
+        -- path: Path to write the file to
+        -- text: Contents of the file
+        """
+        # Text files name the item they belong to, so they are never the same
+        self.submit(name, path, str.encode, text, dedup=False)
+    def flush(self):
+        """
+        Wait for every queued file to be written
+        Returns a list of (item name, path, exception) for files that failed
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: self.queued == 0)
+            ret = self.errors
+            self.errors = []
+        return ret
+    def close(self):
+        """
+        Write every queued file and stop the threads
+        Returns a list of (item name, path, exception) for files that failed
+        """
+        ret = self.flush()
+        self.executor.shutdown()
+        return ret
+
+def encode_png(image, compress_level=PNG_COMPRESS_LEVEL):
+    """
+    Encode an image as PNG
+    -- image: Image to encode
+    -- compress_level: zlib compression level
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=compress_level)
+    return buffer.getvalue()
+
+def encode_png_indexed(image, compress_level=PNG_COMPRESS_LEVEL):
+    """
+    Encode an RGBA image as a palettized PNG, with the alpha of each palette
+    color in its transparency chunk. Every pixel keeps its exact RGBA value.
+    Returns None if the image has more than 256 colors
+    -- image: Image to encode
+    -- compress_level: zlib compression level
+    """
+    pixels = numpy.asarray(image.convert("RGBA"))
+    (height, width, _) = pixels.shape
+    colors = pixels.reshape(-1, 4).view(numpy.uint32).ravel()
+    (palette, indices) = numpy.unique(colors, return_inverse=True)
+    if len(palette) > 256:
+        return None
+    palette = palette.view(numpy.uint8).reshape(-1, 4)
+    ret = Image.fromarray(indices.astype(numpy.uint8).reshape(height, width), "P")
+    ret.putpalette(palette[:, :3].tobytes())
+    buffer = io.BytesIO()
+    params = {"transparency": palette[:, 3].tobytes()}
+    if "icc_profile" in image.info:
+        params["icc_profile"] = image.info["icc_profile"]
+    ret.save(buffer, "PNG", compress_level=compress_level, **params)
+    return buffer.getvalue()
@@ -1,16 +1,25 @@
 #!/usr/bin/python3
 from generators import namegen
-from generators.item import IsaacItem
+from generators.item import generate_item_record
 from generators.item import POOL_NAMES
 from generators.state import IsaacGenState
 from generators import scriptgen
 from generators import util
 from generators import filepicker
+from generators import image
 from generators import Generator
+from generators import build as build_module
+from generators.build import BuildManifest
+from generators import writer
+from generators.writer import FileWriter
 import os
 import sys
 import shutil
 import random
+import argparse
+import glob
+import time
+import multiprocessing
 import xml.etree.ElementTree
 
 # Generate X number of items
@@ -27,77 +36,192 @@ HARDCODED_ITEMS = {
     7: ("Grand Dad", "Press Start to Rich")
 }
 HARDCODED_ITEM_NAMES = [x for (x, _) in HARDCODED_ITEMS.values()]
+# Files that watch mode checks for changes
+CONST_WATCH_FILES = ["generators/**/*", "costumenames.json"]
+# Seconds between checks for changed files in watch mode
+WATCH_INTERVAL = 1.0
+# Item numbers go from 1 to MAX_ITEM_NUMBER
+MAX_ITEM_NUMBER = 700000
+# Hardcoded item numbers, which random items can not use
+HARDCODED_ITEM_NUMBERS = sorted(x for x in HARDCODED_ITEMS
+    if x >= 1 and x <= MAX_ITEM_NUMBER)
 
 # Utility functions
-def generate_card_effect(name):
+def generate_card_effect(name, master_seed=""):
     # tempitem = IsaacItem(name, None)
-    state = IsaacGenState(name)
+    rng = random.Random(util.get_seed(name, master_seed))
+    state = IsaacGenState(name, rng=rng)
     effect = scriptgen.generate_card_effect(state)
     return (util.generate_lua_function([], effect.get_output()),
             state.gen_description())
 
-def generate_pill_effect(name):
+def generate_pill_effect(name, master_seed=""):
     # tempitem = IsaacItem(name, None)
-    state = IsaacGenState(name)
+    rng = random.Random(util.get_seed(name, master_seed))
+    state = IsaacGenState(name, rng=rng)
     effect = scriptgen.generate_pill_effect(state)
     return (util.generate_lua_function([], effect.get_output()),
             state.gen_description())
 
-def generate_item(generator, name, full_name):
-    seed = hash(name)
-    item = IsaacItem(full_name, seed)
-    generator.add_item(item, name)
-
-def generate_items(generator, numitems):
-    max_failed_tries = numitems
-    valid_item_ids = [x for x in range(1, 700000+1) if x not in HARDCODED_ITEMS]
-    numbers = random.sample(valid_item_ids, numitems)
-    while len(numbers) > 0 and max_failed_tries > 0:
-        name = namegen.generate_name()
-        if generator.has_item(name) or name in HARDCODED_ITEM_NAMES:
-            max_failed_tries -= 1
-        else:
-            full_name = str(numbers.pop()) + " " + name
-            generate_item(generator, name, full_name)
+def generate_records(pool, jobs, manifest):
+    """
+    Generate item records in order, in parallel if there is a process pool
+    Items whose inputs have not changed since the last build are loaded from
+    the build cache instead
+    -- pool: Process pool to generate with, or None
+    -- jobs: List of (name, seed, trinket) tuples
+    -- manifest: BuildManifest to look up and add records to
+    """
+    # Cached records are only loaded as they are needed, so that only a few
+    # are in memory at once
+    is_cached = [manifest.has_record(job) for job in jobs]
+    dirty = [job for job, cached in zip(jobs, is_cached) if not cached]
+    if pool == None:
+        generated = map(generate_item_record, dirty)
+    else:
+        generated = pool.imap(generate_item_record, dirty, chunksize=4)
+    for job, cached in zip(jobs, is_cached):
+        record = None
+        if cached:
+            record = manifest.get_record(job)
+        if record == None:
+            if cached:
+                # The cached record is broken, so generate it again here
+                record = generate_item_record(job)
+            else:
+                record = next(generated)
+            manifest.add_record(job, record)
+        yield record
+
+def get_item_number(index):
+    """
+    Get the index-th item number that is not hardcoded
+    -- index: Index of the number, starting at 0
+    """
+    number = index + 1
+    for reserved in HARDCODED_ITEM_NUMBERS:
+        if number >= reserved:
+            number += 1
+    return number
+
+def plan_items(numitems, numtrinkets):
+    """
+    Pick unique names and numbers for items, and unique names for trinkets
+    Names are picked together, so that no item and trinket share a name
+    Returns a list of (name, full_name) tuples for items, and a list of
+    trinket names
+    """
+    ret = []
+    # Pick a few spare names, in case any are the same as a hardcoded item
+    names = namegen.sample_names(numitems + numtrinkets + len(HARDCODED_ITEM_NAMES))
+    names = [x for x in names if x not in HARDCODED_ITEM_NAMES]
+    trinkets = names[numitems:numitems + numtrinkets]
+    names = names[:numitems]
+    indices = random.sample(range(MAX_ITEM_NUMBER - len(HARDCODED_ITEM_NUMBERS)),
+                            numitems)
+    for name, index in zip(names, indices):
+        full_name = str(get_item_number(index)) + " " + name
+        ret.append((name, full_name))
     for num, (name, desc) in HARDCODED_ITEMS.items():
         full_name = str(num) + " " + name
-        generate_item(generator, name, full_name)
-
-def generate_trinkets(generator, numtrinkets):
-    max_failed_tries = numtrinkets
-    while numtrinkets > 0 and max_failed_tries > 0:
-        name = namegen.generate_name()
-        if generator.has_trinket(name):
-            max_failed_tries -= 1
-            continue
-        numtrinkets -= 1
-        seed = hash(name)
-        trinket = IsaacItem(name, seed, True)
+        ret.append((name, full_name))
+    # Items with the same name would overwrite each other in the mod
+    planned = [name for (name, full_name) in ret] + trinkets
+    if len(set(planned)) != len(planned):
+        raise ValueError("Planned the same item or trinket name twice")
+    return (ret, trinkets)
+
+def generate_items(generator, planned, master_seed, manifest, writer, pool=None):
+    jobs = [(full_name, util.get_seed(name, master_seed), False)
+            for (name, full_name) in planned]
+    for (name, full_name), item in zip(planned,
+                                       generate_records(pool, jobs, manifest)):
+        item.write_files(writer)
+        generator.add_item(item, name)
+
+def generate_trinkets(generator, names, master_seed, manifest, writer,
+                      pool=None):
+    jobs = [(name, util.get_seed(name, master_seed), True)
+            for name in names]
+    for trinket in generate_records(pool, jobs, manifest):
+        trinket.write_files(writer)
         generator.add_trinket(trinket)
 
-def generate_pills(generator, num):
+def generate_pills(generator, num, master_seed):
     pill_names = {}
     for i in range(0, num):
         rand_name = namegen.generate_name()
-        (pill_script, pill_name) = generate_pill_effect(rand_name)
+        (pill_script, pill_name) = generate_pill_effect(rand_name, master_seed)
         pill_names[pill_name] = pill_script
     # write out pills
     for pill_name, pill_script in pill_names.items():
         generator.add_pocket_pill(pill_name, pill_script)
 
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Generate the 700000items mod.")
+    parser.add_argument("numitems", nargs="?", default=str(NUM_ITEMS),
+        help="number of items to generate, or 'release' for the release build")
+    parser.add_argument("--seed", default=None,
+        help="master seed of the build; builds with the same seed and number "
+        "of items generate the same items. Without one, the seed of the last "
+        "build is used again until --clean is passed")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="number of processes to generate items with")
+    parser.add_argument("--recolor-cache-size", type=int,
+        default=image.RECOLOR_CACHE_SIZE,
+        help="number of recolored sprite parts each process keeps in memory")
+    parser.add_argument("--indexed-png", action="store_true",
+        help="write sprites as palettized PNGs, which are smaller but look "
+        "exactly the same")
+    parser.add_argument("--png-compression", type=int,
+        default=writer.PNG_COMPRESS_LEVEL, choices=range(0, 10),
+        metavar="{0-9}", help="zlib compression level of sprites")
+    parser.add_argument("--no-dedup", action="store_true",
+        help="write every sprite and animation as its own file, instead of "
+        "hardlinking identical ones together")
+    parser.add_argument("--lazy-items", action="store_true",
+        help="only create the definition of an item the first time it is "
+        "seen in a run, which makes the game boot faster")
+    parser.add_argument("--no-shared-functions", action="store_true",
+        help="write every function of every item out in full, instead of "
+        "sharing the functions that items have in common")
+    parser.add_argument("--watch", action="store_true",
+        help="keep running, and regenerate the items that use a template or "
+        "sprite part whenever it changes")
+    parser.add_argument("--clean", action="store_true",
+        help="remove the previous build and its cache, and generate every "
+        "item again")
+    return parser.parse_args(args)
+
 def main(args):
-    numitems = NUM_ITEMS
     # Parse arguments
-    if len(args) > 0:
-        arg = args[0]
-        if arg == "release":
-            arg = NUM_ITEMS_RELEASE
-        numitems = int(arg)
+    options = parse_args(args)
+    numitems = options.numitems
+    if numitems == "release":
+        numitems = NUM_ITEMS_RELEASE
+    numitems = int(numitems)
 
-    # Remove previous mod folder
-    if os.path.exists(util.TARGET_FOLDER):
-        print("Removing previous mod folder...")
-        shutil.rmtree(util.TARGET_FOLDER)
+    # Remove previous mod folder. Without a manifest, there is no telling
+    # which of its files are stale, so it is removed too.
+    clean = options.clean
+    if not clean and os.path.exists(util.TARGET_FOLDER) and \
+            build_module.load_manifest() == None:
+        print("No build cache found for the previous mod folder.")
+        clean = True
+    if clean:
+        if os.path.exists(util.TARGET_FOLDER):
+            print("Removing previous mod folder...")
+            shutil.rmtree(util.TARGET_FOLDER)
+        if os.path.exists(util.CACHE_FOLDER):
+            shutil.rmtree(util.CACHE_FOLDER)
+
+    # Builds without a seed keep using the same one, so that they can reuse
+    # the items of the last build
+    master_seed = options.seed
+    if master_seed == None:
+        master_seed = build_module.get_default_seed()
+        print("Using seed {}, pass --clean for different items.".format(master_seed))
+    random.seed(master_seed)
 
     # Make sure folders exist
     util.check_folder(util.get_output_path('content'))
@@ -118,37 +242,157 @@ def main(args):
             quit()
         print("Not a valid yes or no answer")
 
+    # Every build plans the same items, so that watch mode only has to
+    # regenerate the ones whose files changed
+    planner_state = random.getstate()
+    build(options, numitems, master_seed, planner_state)
+    if options.watch:
+        watch(options, numitems, master_seed, planner_state)
+
+def build(options, numitems, master_seed, planner_state):
+    """
+    Generate the mod, reusing every item that has not changed
+    Returns the BuildManifest of the build
+    -- options: Parsed command line options
+    -- numitems: Number of items to generate
+    -- master_seed: Seed of the whole build
+    -- planner_state: State of the global random generator to plan items with
+    """
+    random.setstate(planner_state)
+
+    # Decode sprite parts up front
+    image.init_worker(options.recolor_cache_size)
+
     # Create generator
     script = open(util.get_output_path("main.lua"), 'w')
     with open("generators/script/header.lua", 'r') as header:
         script.write(header.read())
-    generator = Generator(script)
+    xml_items_filename = util.get_output_path('content/items.xml')
+    xml_pools_filename = util.get_output_path('content/itempools.xml')
+    xml_pocketitems_filename = util.get_output_path('content/pocketitems.xml')
+    xml_entities_filename = util.get_output_path('content/entities2.xml')
+    generator = Generator(script, xml_items_filename, xml_entities_filename,
+        xml_pools_filename, xml_pocketitems_filename, options.lazy_items,
+        not options.no_shared_functions)
 
     # Generate a bunch of stuff
-    generate_items(generator, numitems)
-    generate_trinkets(generator, NUM_TRINKETS)
+    manifest = BuildManifest({
+        "indexed_png": options.indexed_png,
+        "png_compression": options.png_compression,
+        "dedup": not options.no_dedup,
+    })
+    store_path = build_module.BLOBS_PATH
+    if options.no_dedup:
+        store_path = None
+    file_writer = FileWriter(indexed=options.indexed_png,
+                             compress_level=options.png_compression,
+                             store_path=store_path)
+    pool = None
+    if options.jobs > 1:
+        pool = multiprocessing.Pool(options.jobs, image.init_worker,
+                                    (options.recolor_cache_size,))
+    (items, trinkets) = plan_items(numitems, NUM_TRINKETS)
+    generate_items(generator, items, master_seed, manifest, file_writer, pool)
+    generate_trinkets(generator, trinkets, master_seed, manifest,
+                      file_writer, pool)
+    if pool != None:
+        pool.close()
+        pool.join()
     generator.script_generate_itemnames()
-    generate_pills(generator, NUM_PILLS)
+    generate_pills(generator, NUM_PILLS, master_seed)
+    generator.script_generate_pillnames()
     with open("generators/script/footer.lua", 'r') as footer:
         generator.lua_script.write(footer.read())
 
-    # Write out created stuff
-    xml_items_filename = util.get_output_path('content/items.xml')
-    xml_pools_filename = util.get_output_path('content/itempools.xml')
-    xml_pocketitems_filename = util.get_output_path('content/pocketitems.xml')
-    xml_entities_filename = util.get_output_path('content/entities2.xml')
-    generator.write_items(xml_items_filename)
-    generator.write_entities(xml_entities_filename)
-    generator.write_pools(xml_pools_filename)
-    generator.write_pocketitems(xml_pocketitems_filename)
+    # Finish writing out created stuff
+    generator.close()
+    script.close()
+    errors = file_writer.close()
+    manifest.save()
+    file_writer.prune_store()
 
     # Output metadata
     shutil.copy("metadata.xml", util.TARGET_FOLDER)
     shutil.copy("preview.jpg", util.TARGET_FOLDER)
 
     # Final prints
+    if len(errors) > 0:
+        for (name, path, err) in errors:
+            print("Error: could not write {} for {}: {}".format(path, name, err))
+        print("Failed to write {} files.".format(len(errors)))
+        if not options.watch:
+            sys.exit(1)
+        return manifest
     print("Done!")
     print("Generated {} items.".format(len(generator.itemnames)))
+    print("Rebuilt {} items and trinkets, reused {} unchanged.".format(
+        manifest.misses, manifest.hits))
+    if options.indexed_png:
+        print("Indexed sprites saved {} bytes.".format(file_writer.bytes_saved))
+    if file_writer.copied > 0:
+        print("Could not hardlink files here, so {} files were copied.".format(
+            file_writer.copied))
+    elif file_writer.stored > 0:
+        print("Wrote {} sprites as {} distinct ones, dedup ratio {:.2f}.".format(
+            file_writer.stored, len(file_writer.blobs),
+            file_writer.get_dedup_ratio()))
+    shared = generator.shared
+    if shared != None and shared.functions > 0:
+        print("Shared {} of {} Lua functions as {} shared ones, {} bytes smaller.".format(
+            shared.replaced, shared.functions, shared.count, shared.bytes_saved))
+    if pool == None:
+        print("Recolored parts: {} cached, {} recolored.".format(
+            image.recolor_cache.hits, image.recolor_cache.misses))
+    return manifest
+
+def get_watched_files():
+    """
+    Get the modification time of every file the generator reads
+    """
+    ret = {}
+    for pattern in CONST_WATCH_FILES:
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and not "__pycache__" in path:
+                ret[os.path.normpath(path)] = os.path.getmtime(path)
+    return ret
+
+def watch(options, numitems, master_seed, planner_state):
+    """
+    Rebuild the mod whenever a template or sprite part changes
+    Restarts the program if the generator code itself changes
+    -- options: Parsed command line options
+    -- numitems: Number of items to generate
+    -- master_seed: Seed of the whole build
+    -- planner_state: State of the global random generator to plan items with
+    """
+    manifest = BuildManifest()
+    mtimes = get_watched_files()
+    print("Watching for changes, press Ctrl+C to stop...")
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        new_mtimes = get_watched_files()
+        changed = [path for path in set(mtimes) | set(new_mtimes)
+                   if mtimes.get(path) != new_mtimes.get(path)]
+        mtimes = new_mtimes
+        if len(changed) == 0:
+            continue
+        if any(build_module.is_code_file(path) for path in changed):
+            print("Generator code changed, restarting...")
+            args = [x for x in sys.argv if x != "--clean"]
+            os.execv(sys.executable, [sys.executable] + args)
+        affected = set()
+        for path in sorted(changed):
+            items = manifest.get_dependents(path)
+            print("Changed {}, used by {} items.".format(path, len(items)))
+            affected.update(items)
+            build_module.forget_file(path)
+            scriptgen.forget_template(path)
+            filepicker.forget_folder(os.path.dirname(path))
+            image.forget_part(path)
+        print("Regenerating {} items...".format(len(affected)))
+        manifest = build(options, numitems, master_seed, planner_state)
+
 
 # Enter main function here
-main(sys.argv[1:])
+if __name__ == "__main__":
+    main(sys.argv[1:])